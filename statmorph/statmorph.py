@@ -7,19 +7,19 @@ of galaxy images.
 from pkg_resources import parse_version
 import warnings
 import time
+import os
+import concurrent.futures
 import numpy as np
 import scipy.optimize as opt
 import scipy.ndimage as ndi
 import scipy.signal
+import scipy.fftpack
 import skimage.measure
-import skimage.transform
-import skimage.feature
 import skimage.segmentation
 from astropy.utils import lazyproperty
 from astropy.stats import sigma_clipped_stats, mad_std
 from astropy.modeling import models, fitting
 from astropy.utils.exceptions import AstropyUserWarning
-from astropy.convolution import convolve
 import photutils
 
 __all__ = ['ConvolvedSersic2D', 'SourceMorphology', 'source_morphology',
@@ -135,6 +135,9 @@ _quantity_names_nofit = [
     'distance_center_asymmetry',
 ]
 
+# Neighbor "footprint" for growing regions, including corners:
+_structure_8conn = ndi.generate_binary_structure(2, 2)
+
 
 def _quantile(sorted_values, q):
     """
@@ -146,11 +149,181 @@ def _quantile(sorted_values, q):
     The result is identical to np.percentile(..., interpolation='lower'),
     but the currently defined function is infinitely faster for sorted arrays.
     """
-    if q < 0 or q > 1:
+    # A single chained comparison, which also rejects NaN:
+    if not 0 <= q <= 1:
         raise ValueError('Quantiles must be in the range [0, 1].')
     return sorted_values[int(q*(len(sorted_values)-1))]
 
 
+def _mode_estimator(data, axis=None):
+    """
+    Estimate the "mode" of a 1-d array as in Bertin & Arnouts (1996),
+    i.e., 2.5 * median - 1.5 * mean, after 3-sigma clipping around
+    the median (with at most 10 iterations).
+
+    Notes
+    -----
+    The result is identical to calling
+    ``photutils.ModeEstimatorBackground(median_factor=2.5,
+    mean_factor=1.5)`` with its default sigma clipping, but avoids
+    the overhead of masked arrays, which adds up when this function
+    is used as ``cenfunc`` in ``sigma_clipped_stats``. The ``axis``
+    argument is only accepted for compatibility with that interface.
+    """
+    valid = np.ones(data.shape, dtype=bool)
+    clipped = data
+    for _ in range(10):
+        median = np.median(clipped)
+        std = np.std(clipped)
+        valid &= (data >= median - 3.0*std) & (data <= median + 3.0*std)
+        num_valid = np.count_nonzero(valid)
+        if num_valid == clipped.size:
+            break
+        clipped = data[valid]
+
+    # Sum over the full array (with clipped values set to zero) in
+    # order to reproduce the summation order of masked arrays.
+    mean = np.sum(np.where(valid, data, 0)) * 1.0 / num_valid
+    return 2.5*np.median(clipped) - 1.5*mean
+
+
+def _gaussian_filter(image, sigma):
+    """
+    Same as ``scipy.ndimage.gaussian_filter`` (with the default
+    ``mode='reflect'`` and ``truncate=4.0``), but for large ``sigma``
+    the convolution along each axis is carried out with FFTs, which
+    is faster than direct convolution in that regime.
+    """
+    if sigma <= 10.0:
+        return ndi.gaussian_filter(image, sigma)
+
+    # Same kernel as ``scipy.ndimage.gaussian_filter``:
+    radius = int(4.0 * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 / sigma**2 * x**2)
+    kernel /= np.sum(kernel)
+
+    result = np.asarray(image, dtype=np.float64)
+    for axis in range(result.ndim):
+        # Mode 'symmetric' in np.pad is mode 'reflect' in ndimage.
+        pad_width = [(0, 0)] * result.ndim
+        pad_width[axis] = (radius, radius)
+        padded = np.pad(result, pad_width, mode='symmetric')
+        n = padded.shape[axis] + len(kernel) - 1
+        nfft = scipy.fftpack.next_fast_len(n)
+        kernel_shape = [1] * result.ndim
+        kernel_shape[axis] = -1
+        kernel_fft = np.fft.rfft(kernel, nfft).reshape(kernel_shape)
+        convolved = np.fft.irfft(np.fft.rfft(padded, nfft, axis=axis)
+                                 * kernel_fft, nfft, axis=axis)
+        # Keep the part where the kernel fully overlaps the padded image:
+        valid = [slice(None)] * result.ndim
+        valid[axis] = slice(2*radius, n - 2*radius)
+        result = convolved[tuple(valid)]
+
+    return result.astype(image.dtype, copy=False)
+
+
+def _shift_bilinear(image, shift):
+    """
+    Shift a 2D image by ``shift`` = (dy, dx) pixels using bilinear
+    interpolation and zero-padding beyond the edges. This is the same
+    as ``ndi.shift(image, shift, order=1, mode='grid-constant')``,
+    but carried out as a weighted sum of four shifted slices, which
+    avoids the per-pixel coordinate mapping.
+    """
+    ny, nx = image.shape
+    dy, dx = shift
+    iy, ix = int(np.floor(dy)), int(np.floor(dx))
+    fy, fx = dy - iy, dx - ix
+
+    # Integer-shifted (and zero-padded) copy such that
+    # shifted[i, j] = image[i - iy - 1, j - ix - 1]:
+    shifted = np.zeros((ny + 1, nx + 1), dtype=np.float64)
+    i0, i1 = max(0, iy + 1), min(ny + 1, ny + iy + 1)
+    j0, j1 = max(0, ix + 1), min(nx + 1, nx + ix + 1)
+    if i0 < i1 and j0 < j1:
+        shifted[i0:i1, j0:j1] = image[i0-iy-1:i1-iy-1, j0-ix-1:j1-ix-1]
+
+    # Interpolate along each axis
+    shifted = (1.0 - fy) * shifted[1:, :] + fy * shifted[:-1, :]
+    return (1.0 - fx) * shifted[:, 1:] + fx * shifted[:, :-1]
+
+
+def _rotate_180(image, center, flipped=False):
+    """
+    Rotate ``image`` by 180 degrees around ``center`` = (x, y), with
+    bilinear interpolation and zero-padding beyond the edges, as in
+    ``skimage.transform.rotate(image, 180.0, center=center)``.
+
+    Such a rotation is simply a flip along both axes followed by a
+    (sub-pixel) shift. If ``flipped`` is True, ``image`` is assumed to
+    have been flipped along both axes already.
+    """
+    ny, nx = image.shape
+    xc, yc = center
+    if not flipped:
+        image = image[::-1, ::-1]
+    return _shift_bilinear(image, (2.0*yc - (ny-1), 2.0*xc - (nx-1)))
+
+
+def _rotate_180_nearest(mask, center, flipped=False):
+    """
+    Rotate a boolean ``mask`` by 180 degrees around ``center`` = (x, y),
+    with nearest-neighbor sampling and zero-padding beyond the edges, as
+    ``skimage.transform.rotate(mask, 180.0, center=center)`` does for
+    boolean input.
+
+    In this case the (sub-pixel) shift of ``_rotate_180`` is rounded
+    to an integer number of pixels, so the rotation reduces to copying
+    a slice. Results can only differ from skimage when twice the center
+    is exactly halfway between two pixels, where skimage breaks the tie
+    according to roundoff errors. If ``flipped`` is True, ``mask`` is
+    assumed to have been flipped along both axes already.
+    """
+    ny, nx = mask.shape
+    xc, yc = center
+    if not flipped:
+        mask = mask[::-1, ::-1]
+    # Such that rotated[i, j] = mask[i - dy, j - dx] (flipped mask):
+    dy = int(np.floor(2.0*yc + 0.5)) - (ny-1)
+    dx = int(np.floor(2.0*xc + 0.5)) - (nx-1)
+
+    rotated = np.zeros((ny, nx), dtype=bool)
+    i0, i1 = max(0, dy), min(ny, ny + dy)
+    j0, j1 = max(0, dx), min(nx, nx + dx)
+    if i0 < i1 and j0 < j1:
+        rotated[i0:i1, j0:j1] = mask[i0-dy:i1-dy, j0-dx:j1-dx]
+    return rotated
+
+
+def _peak_local_max(image):
+    """
+    Return the (y, x) coordinates of the local maxima of ``image``
+    within 3x3 neighborhoods, sorted by decreasing pixel value. This
+    is the same as ``skimage.feature.peak_local_max(image,
+    num_peaks=np.inf)`` with the default ``min_distance=1``, for which
+    skimage's additional (KD-tree based) minimum-spacing step has no
+    effect, so it is skipped here.
+    """
+    image_max = ndi.maximum_filter(image, size=3, mode='constant')
+    peak_mask = image == image_max
+    if np.all(peak_mask):
+        # No peaks for a trivial image
+        peak_mask[:] = False
+    peak_mask &= image > np.min(image)
+
+    # Exclude peaks on the border of the image
+    peak_mask[0, :] = peak_mask[-1, :] = False
+    peak_mask[:, 0] = peak_mask[:, -1] = False
+
+    # Highest peak first
+    ypeak, xpeak = np.nonzero(peak_mask)
+    sorted_indices = np.argsort(-image[ypeak, xpeak])
+
+    return ypeak[sorted_indices], xpeak[sorted_indices]
+
+
 def _aperture_area(ap, mask, **kwargs):
     """
     Calculate the area of a photutils aperture object,
@@ -159,6 +332,47 @@ def _aperture_area(ap, mask, **kwargs):
     return ap.do_photometry(np.float64(~mask), **kwargs)[0][0]
 
 
+def _overlap_slices(bbox, shape):
+    """
+    Return the slices of the overlapping region between a photutils
+    bounding box and an array with the given ``shape``, as in
+    ``ApertureMask.get_overlap_slices`` (which requires photutils 1.1).
+    The first slices apply to the large array and the second ones to
+    the small array defined by ``bbox``. Return (None, None) if there
+    is no overlap.
+    """
+    ny, nx = shape
+    if (bbox.iymin >= ny or bbox.ixmin >= nx or
+            bbox.iymax <= 0 or bbox.ixmax <= 0):
+        return None, None
+
+    ymin, ymax = max(bbox.iymin, 0), min(bbox.iymax, ny)
+    xmin, xmax = max(bbox.ixmin, 0), min(bbox.ixmax, nx)
+    slc_large = (slice(ymin, ymax), slice(xmin, xmax))
+    slc_small = (slice(ymin - bbox.iymin, ymax - bbox.iymin),
+                 slice(xmin - bbox.ixmin, xmax - bbox.ixmin))
+    return slc_large, slc_small
+
+
+def _aperture_sums(ap, images, **kwargs):
+    """
+    Same as ``ap.do_photometry(image, **kwargs)[0][0]`` for each
+    image in ``images`` (all with the same shape), but computing
+    the aperture mask (i.e., the pixel weights) only once.
+    """
+    apermask = ap.to_mask(**kwargs)
+    slc_large, slc_small = _overlap_slices(apermask.bbox, images[0].shape)
+    if slc_large is None:
+        return [np.nan for image in images]
+
+    # Only keep pixels with nonzero weights, as in photutils:
+    weights = apermask.data[slc_small]
+    locs = weights > 0
+    weights = weights[locs]
+
+    return [np.sum(image[slc_large][locs] * weights) for image in images]
+
+
 def _aperture_mean_nomask(ap, image, **kwargs):
     """
     Calculate the mean flux of an image for a given photutils
@@ -171,122 +385,387 @@ def _aperture_mean_nomask(ap, image, **kwargs):
     return ap.do_photometry(image, **kwargs)[0][0] / ap.area
 
 
-def _fraction_of_total_function_circ(r, image, center, fraction, total_sum):
+def _half_disk_area(u, r):
     """
-    Helper function to calculate ``_radius_at_fraction_of_total_circ``.
+    Return the (signed) area of the upper half of a disk of radius ``r``
+    (centered at the origin) between the vertical lines at 0 and ``u``.
     """
-    assert (r >= 0) & (fraction >= 0) & (fraction <= 1) & (total_sum > 0)
-    if r == 0:
-        cur_fraction = 0.0
-    else:
-        ap = photutils.CircularAperture(center, r)
-        # Force flux sum to be positive:
-        ap_sum = np.abs(ap.do_photometry(image, method='exact')[0][0])
-        cur_fraction = ap_sum / total_sum
+    u = np.clip(u, -r, r)
+    h = np.sqrt((r - u) * (r + u))
+    return 0.5 * (u * h + r**2 * np.arctan2(u, h))
 
-    return cur_fraction - fraction
 
+def _disk_corner_area(x, y, gx, gy, r):
+    """
+    Return the area of the part of a disk of radius ``r`` (centered
+    at the origin) with coordinates larger than ``(x, y)``, where
+    ``gx`` and ``gy`` are the corresponding ``_half_disk_area`` values.
+    """
+    quarter = 0.25 * np.pi * r**2
+    area_inside = quarter - gx - gy + x * y
+    xneg, yneg = x < 0, y < 0
+    area_outside = (xneg * (2.0*quarter - 2.0*gy)
+                    + yneg * (2.0*quarter - 2.0*gx)
+                    - (xneg & yneg) * (4.0*quarter))
+    return np.where(x**2 + y**2 < r**2, area_inside, area_outside)
 
-def _radius_at_fraction_of_total_circ(image, center, r_total, fraction):
+
+def _circular_overlap_exact(xmin, xmax, ymin, ymax, r):
     """
-    Return the radius (in pixels) of a concentric circle that
-    contains a given fraction of the light within ``r_total``.
+    Return the exact area of the intersection between a disk of radius
+    ``r`` (centered at the origin) and the rectangles (e.g. pixels)
+    defined by the given boundaries.
     """
-    flag = 0  # flag=1 indicates a problem
+    gx_min, gx_max = _half_disk_area(xmin, r), _half_disk_area(xmax, r)
+    gy_min, gy_max = _half_disk_area(ymin, r), _half_disk_area(ymax, r)
+    return (_disk_corner_area(xmin, ymin, gx_min, gy_min, r)
+            - _disk_corner_area(xmax, ymin, gx_max, gy_min, r)
+            - _disk_corner_area(xmin, ymax, gx_min, gy_max, r)
+            + _disk_corner_area(xmax, ymax, gx_max, gy_max, r))
 
-    ap_total = photutils.CircularAperture(center, r_total)
 
-    total_sum = ap_total.do_photometry(image, method='exact')[0][0]
-    assert total_sum != 0
-    if total_sum < 0:
-        warnings.warn('[r_circ] Total flux sum is negative.',
-                      AstropyUserWarning)
-        flag = 1
-        total_sum = np.abs(total_sum)
+def _unit_disk_triangle_area(ax, ay, bx, by):
+    """
+    Return the signed area of the intersection between the unit disk
+    and the triangle formed by the origin and the points ``a`` and ``b``.
+    """
+    dx, dy = bx - ax, by - ay
+    qa = dx**2 + dy**2
+    qb = ax*dx + ay*dy
+    qc = ax**2 + ay**2 - 1.0
+    disc = np.maximum(qb**2 - qa*qc, 0.0)
+    sqrt_disc = np.sqrt(disc)
+    # The segment is inside the unit circle between t1 and t2:
+    t1 = np.where(disc > 0, np.clip((-qb - sqrt_disc) / qa, 0.0, 1.0), 0.0)
+    t2 = np.where(disc > 0, np.clip((-qb + sqrt_disc) / qa, 0.0, 1.0), 0.0)
+    px, py = ax + t1*dx, ay + t1*dy
+    qx, qy = ax + t2*dx, ay + t2*dy
+    # Circular sectors outside the circle and a triangle inside it:
+    return 0.5 * (np.arctan2(ax*py - ay*px, ax*px + ay*py)
+                  + (px*qy - py*qx)
+                  + np.arctan2(qx*by - qy*bx, qx*bx + qy*by))
+
+
+def _elliptical_overlap_exact(xmin, xmax, ymin, ymax, a, b, theta):
+    """
+    Return the exact area of the intersection between an ellipse with
+    semiaxes ``a`` and ``b`` and orientation ``theta`` (centered at
+    the origin) and the rectangles (e.g. pixels) defined by the given
+    boundaries.
+    """
+    # Map the ellipse onto the unit disk and the rectangles onto
+    # parallelograms, whose corners are listed counterclockwise.
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+    u = [(x*cos_theta + y*sin_theta) / a for x, y in corners]
+    v = [(-x*sin_theta + y*cos_theta) / b for x, y in corners]
+    area = 0.0
+    for k in range(4):
+        area = area + _unit_disk_triangle_area(
+            u[k], v[k], u[(k+1) % 4], v[(k+1) % 4])
+    return a * b * area
+
+
+def _elliptical_radii(dx, dy, elongation, theta):
+    """
+    Return the "elliptical radii" of the points at ``(dx, dy)``, i.e.,
+    the semimajor axes of the ellipses (centered at the origin, with
+    the given elongation and orientation) that go through them.
+    """
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    xprime = dx*cos_theta + dy*sin_theta
+    yprime = -dx*sin_theta + dy*cos_theta
+    return np.sqrt(xprime**2 + (yprime*elongation)**2)
 
-    # Find appropriate range for root finder
-    npoints = 100
-    r_grid = np.linspace(0.0, r_total, num=npoints)
-    i = 0  # initial value
-    while True:
-        assert i < npoints, 'Root not found within range.'
-        r = r_grid[i]
-        curval = _fraction_of_total_function_circ(
-            r, image, center, fraction, total_sum)
-        if curval <= 0:
-            r_min = r
-        elif curval > 0:
-            r_max = r
-            break
-        i += 1
 
-    r = opt.brentq(_fraction_of_total_function_circ, r_min, r_max,
-                   args=(image, center, fraction, total_sum), xtol=1e-6)
+def _elliptical_annulus_flux(image, center, a_in, a_out, elongation, theta):
+    """
+    Return the flux sum (using exact pixel overlaps) over an elliptical
+    annulus with the given semimajor axes, elongation and orientation
+    around ``center``.
 
-    return r, flag
+    Notes
+    -----
+    Only the pixels that cross the edges of the annulus require
+    the exact overlap calculation. The "elliptical radius" changes
+    at most a factor ``elongation`` faster than the distance to the
+    center, which bounds the pixels that can cross an edge.
 
+    """
+    ny, nx = image.shape
+    y, x = np.mgrid[0:ny, 0:nx]
+    dx = x - center[0]
+    dy = y - center[1]
+    r_ellip = _elliptical_radii(dx, dy, elongation, theta)
+    edge_width = 0.5 * np.sqrt(2.0) * max(elongation, 1.0)
+
+    flux = 0.0
+    for a, sign in [(a_out, 1.0), (a_in, -1.0)]:
+        if a <= 0:
+            continue
+        locs_in = r_ellip < a - edge_width
+        locs_edge = np.abs(r_ellip - a) <= edge_width
+        dx_edge, dy_edge = dx[locs_edge], dy[locs_edge]
+        overlap = _elliptical_overlap_exact(
+            dx_edge - 0.5, dx_edge + 0.5, dy_edge - 0.5, dy_edge + 0.5,
+            a, a / elongation, theta)
+        flux += sign * (np.sum(image[locs_in], dtype=np.float64)
+                        + np.sum(overlap * image[locs_edge]))
+
+    return flux
+
+
+class _CurveOfGrowthCirc(object):
+    """
+    The "curve of growth" of an image around a fixed center, i.e.,
+    the flux within concentric circles as a function of their radius,
+    using exact pixel overlaps.
 
-def _fraction_of_total_function_ellip(a, image, center, elongation, theta,
-                                      fraction, total_sum):
+    Notes
+    -----
+    The pixels are sorted by their distance to the center only once,
+    so that the flux of the pixels that are completely contained
+    within a circle is just a cumulative sum. The exact overlap is
+    only calculated for the pixels that cross the edge of the circle.
+
+    """
+    def __init__(self, image, center):
+        ny, nx = image.shape
+        xc, yc = center
+        y, x = np.mgrid[0:ny, 0:nx]
+        dx = (x - xc).ravel()
+        dy = (y - yc).ravel()
+        distances = self._radial_distances(dx, dy)
+        # A pixel is completely inside (outside) a curve of size r
+        # if its distance is smaller (larger) than r by more than:
+        self._edge_width = 0.5 * np.sqrt(2.0)  # half diagonal of a pixel
+
+        sorted_indices = np.argsort(distances)
+        self._distances = distances[sorted_indices]
+        self._dx = dx[sorted_indices]
+        self._dy = dy[sorted_indices]
+        # Keep the pixel values in their original precision (usually
+        # float32), but accumulate them in double precision:
+        self._pixelvals = image.ravel()[sorted_indices]
+        self._cumsum = np.concatenate(
+            ([0.0], np.cumsum(self._pixelvals, dtype=np.float64)))
+
+    def _radial_distances(self, dx, dy):
+        """
+        Return the distances of the pixels to the center.
+        """
+        return np.sqrt(dx**2 + dy**2)
+
+    def _overlap(self, dx, dy, r):
+        """
+        Return the exact overlaps of the pixels at ``(dx, dy)``
+        with the curves of size ``r``.
+        """
+        return _circular_overlap_exact(dx - 0.5, dx + 0.5,
+                                       dy - 0.5, dy + 0.5, r)
+
+    def __call__(self, radii):
+        """
+        Return the flux within circles of the given radii.
+        Zero radii enclose no flux.
+        """
+        radii = np.atleast_1d(radii)
+        r = radii.ravel()
+
+        # Pixels that are completely inside each circle, or that
+        # cross its edge (note that these are contiguous when sorted):
+        i_in = np.searchsorted(self._distances, r - self._edge_width,
+                               side='right')
+        i_edge = np.searchsorted(self._distances, r + self._edge_width,
+                                 side='left')
+        num_edge = np.where(r > 0, i_edge - i_in, 0)
+
+        # Exact overlaps of all the edge pixels, for all radii at once:
+        k = np.repeat(np.arange(len(r)), num_edge)
+        offsets = np.arange(np.sum(num_edge)) - np.repeat(
+            np.cumsum(num_edge) - num_edge, num_edge)
+        locs = i_in[k] + offsets
+        overlap = self._overlap(self._dx[locs], self._dy[locs], r[k])
+        edge_fluxes = np.bincount(k, weights=overlap * self._pixelvals[locs],
+                                  minlength=len(r))
+
+        fluxes = np.where(r > 0, self._cumsum[i_in] + edge_fluxes, 0.0)
+        return fluxes.reshape(radii.shape)
+
+
+class _CurveOfGrowthEllip(_CurveOfGrowthCirc):
     """
-    Helper function to calculate ``_radius_at_fraction_of_total_ellip``.
+    Same as ``_CurveOfGrowthCirc``, but for concentric ellipses with
+    a given elongation and orientation, as a function of their
+    semimajor axes.
     """
-    assert (a >= 0) & (fraction >= 0) & (fraction <= 1) & (total_sum > 0)
-    if a == 0:
-        cur_fraction = 0.0
-    else:
-        b = a / elongation
-        ap = photutils.EllipticalAperture(center, a, b, theta=theta)
-        # Force flux sum to be positive:
-        ap_sum = np.abs(ap.do_photometry(image, method='exact')[0][0])
-        cur_fraction = ap_sum / total_sum
+    def __init__(self, image, center, elongation, theta):
+        self._elongation = elongation
+        self._theta = theta
+        super().__init__(image, center)
+        # See ``_elliptical_annulus_flux``:
+        self._edge_width *= max(elongation, 1.0)
 
-    return cur_fraction - fraction
+    def _radial_distances(self, dx, dy):
+        """
+        Return the "elliptical radii" of the pixels.
+        """
+        return _elliptical_radii(dx, dy, self._elongation, self._theta)
 
+    def _overlap(self, dx, dy, a):
+        return _elliptical_overlap_exact(
+            dx - 0.5, dx + 0.5, dy - 0.5, dy + 0.5,
+            a, a / self._elongation, self._theta)
 
-def _radius_at_fraction_of_total_ellip(image, center, elongation, theta,
-                                       a_total, fraction):
+
+def _chandrupatla(func, x1, x2, xtol=1e-6, maxiter=100):
     """
-    Return the semimajor axis (in pixels) of a concentric ellipse that
-    contains a given fraction of the light within a larger ellipse of
-    semimajor axis ``a_total``.
+    Find roots of ``func`` within the brackets ``[x1, x2]`` using
+    Chandrupatla's algorithm (Chandrupatla 1997; see also Scherer
+    2010, "Computational Physics", Sec. 6.1.7.2), which combines
+    bisection and inverse quadratic interpolation like Brent's method.
+
+    The brackets are refined simultaneously, so ``func`` must accept
+    a 1D array of abscissae and return the corresponding function
+    values. The roots are returned with the shape of ``x1``.
     """
-    flag = 0  # flag=1 indicates a problem
+    shape = np.shape(x1)
+    x1 = np.atleast_1d(np.float64(x1)).ravel()
+    x2 = np.atleast_1d(np.float64(x2)).ravel()
+    f1, f2 = func(x1), func(x2)
+    assert np.all(np.sign(f1) != np.sign(f2)), 'Root is not bracketed.'
+    x3, f3 = x2, f2
+    t = 0.5
+
+    roots = np.where(np.abs(f1) < np.abs(f2), x1, x2)
+    active = np.arange(len(roots))  # brackets still being refined
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(maxiter):
+            xt = x1 + t * (x2 - x1)
+            ft = func(xt)
+
+            # Update the bracket, keeping the discarded point as x3.
+            same_sign = np.sign(ft) == np.sign(f1)
+            x3 = np.where(same_sign, x1, x2)
+            f3 = np.where(same_sign, f1, f2)
+            x2 = np.where(same_sign, x2, x1)
+            f2 = np.where(same_sign, f2, f1)
+            x1, f1 = xt, ft
+
+            # Best estimate so far and convergence test
+            use_x1 = np.abs(f1) < np.abs(f2)
+            xm = np.where(use_x1, x1, x2)
+            fm = np.where(use_x1, f1, f2)
+            tol = 4.0 * np.finfo(np.float64).eps * np.abs(xm) + xtol
+            tlim = 0.5 * tol / np.abs(x2 - x1)
+            converged = (tlim > 0.5) | (fm == 0)
+            roots[active] = xm
+            if converged.all():
+                break
+
+            # Use inverse quadratic interpolation if the function is
+            # well-behaved enough in the bracket, otherwise bisect.
+            xi = (x1 - x2) / (x3 - x2)
+            phi = (f1 - f2) / (f3 - f2)
+            t = np.where(
+                (phi**2 < xi) & ((1.0 - phi)**2 < 1.0 - xi),
+                (f1 / (f2 - f1) * f3 / (f2 - f3)
+                 + (x3 - x1) / (x2 - x1) * f1 / (f3 - f1) * f2 / (f3 - f2)),
+                0.5)
+            t = np.minimum(np.maximum(t, tlim), 1.0 - tlim)
+
+            # Only keep refining the brackets that have not converged.
+            if converged.any():
+                keep = ~converged
+                active = active[keep]
+                x1, x2, x3 = x1[keep], x2[keep], x3[keep]
+                f1, f2, f3 = f1[keep], f2[keep], f3[keep]
+                t = t[keep]
+        else:
+            warnings.warn('Root finder did not converge.', AstropyUserWarning)
 
-    b_total = a_total / elongation
-    ap_total = photutils.EllipticalAperture(
-        center, a_total, b_total, theta=theta)
+    if shape == ():
+        return roots[0]
+    return roots.reshape(shape)
 
-    total_sum = ap_total.do_photometry(image, method='exact')[0][0]
+
+def _petrosian_mean_fluxes(curve_of_growth, a_values, annulus_width,
+                           elongation=1.0):
+    """
+    For an array of semimajor axes (or radii), return the mean fluxes
+    over elliptical (or circular) annuli and within the corresponding
+    apertures, which are used to calculate the Petrosian "radius".
+
+    Notes
+    -----
+    All the fluxes are obtained from a single "curve of growth"
+    evaluation, since the flux over an annulus is simply the
+    difference between the fluxes within its outer and inner
+    ellipses. Note that we divide by the full area of each aperture,
+    regardless of masked and out-of-range pixels.
+    """
+    a = np.atleast_1d(a_values)
+    a_in = a - 0.5 * annulus_width
+    a_out = a + 0.5 * annulus_width
+
+    flux_in, flux, flux_out = curve_of_growth(np.array([a_in, a, a_out]))
+
+    # Force mean fluxes to be positive:
+    annulus_mean_flux = np.abs(
+        (flux_out - flux_in) / (np.pi * (a_out**2 - a_in**2) / elongation))
+    aperture_mean_flux = np.abs(flux / (np.pi * a**2 / elongation))
+
+    return annulus_mean_flux, aperture_mean_flux
+
+
+def _fraction_of_total_function(r, curve_of_growth, fraction, total_sum):
+    """
+    Helper function to calculate ``_radius_at_fraction_of_total``.
+    """
+    assert (fraction >= 0) & (fraction <= 1) & (total_sum > 0)
+    # Force flux sums to be positive:
+    return np.abs(curve_of_growth(r)) / total_sum - fraction
+
+
+def _radius_at_fraction_of_total(curve_of_growth, r_total, fraction, tag):
+    """
+    Return the radius (or semimajor axis, in pixels) of a concentric
+    circle (or ellipse) that contains a given fraction of the light
+    within ``r_total``, according to the given "curve of growth".
+    """
+    flag = 0  # flag=1 indicates a problem
+
+    total_sum = curve_of_growth(r_total)[0]
     assert total_sum != 0
     if total_sum < 0:
-        warnings.warn('[r_ellip] Total flux sum is negative.',
+        warnings.warn('[%s] Total flux sum is negative.' % (tag,),
                       AstropyUserWarning)
         flag = 1
         total_sum = np.abs(total_sum)
 
-    # Find appropriate range for root finder
+    # Find appropriate range for root finder, evaluating the
+    # curve of growth over blocks of radii at a time.
     npoints = 100
-    a_grid = np.linspace(0.0, a_total, num=npoints)
-    i = 0  # initial value
-    while True:
-        assert i < npoints, 'Root not found within range.'
-        a = a_grid[i]
-        curval = _fraction_of_total_function_ellip(
-            a, image, center, elongation, theta, fraction, total_sum)
-        if curval <= 0:
-            a_min = a
-        elif curval > 0:
-            a_max = a
+    nblock = 10
+    r_grid = np.linspace(0.0, r_total, num=npoints)
+    for k in range(0, npoints, nblock):
+        curvals = _fraction_of_total_function(
+            r_grid[k:k+nblock], curve_of_growth, fraction, total_sum)
+        locs_positive = np.flatnonzero(curvals > 0)
+        if len(locs_positive) > 0:
+            i = k + locs_positive[0]
             break
-        i += 1
+    else:
+        raise AssertionError('Root not found within range.')
+    # Note that the curve is negative at r = 0
+    r_min, r_max = r_grid[i-1], r_grid[i]
 
-    a = opt.brentq(_fraction_of_total_function_ellip, a_min, a_max,
-                   args=(image, center, elongation,
-                         theta, fraction, total_sum),
-                   xtol=1e-6)
+    r = _chandrupatla(
+        lambda r: _fraction_of_total_function(
+            r, curve_of_growth, fraction, total_sum),
+        r_min, r_max, xtol=1e-6)
 
-    return a, flag
+    return r, flag
 
 
 class ConvolvedSersic2D(models.Sersic2D):
@@ -484,7 +963,7 @@ class SourceMorphology(object):
         assert self._segmap.data.shape == self._image.shape
         if self._mask is not None:
             assert self._mask.shape == self._image.shape
-            assert self._mask.dtype == np.bool8
+            assert self._mask.dtype == bool
         if self._weightmap is not None:
             assert self._weightmap.shape == self._image.shape
 
@@ -569,26 +1048,38 @@ class SourceMorphology(object):
 
         Notes
         -----
-        ndi.generic_filter(image, np.std, ...) is too slow,
-        so we do a workaround using ndi.convolve.
+        ndi.generic_filter(image, np.std, ...) is too slow, so instead
+        we accumulate the first and second moments of the 8 neighbors
+        of each pixel in a single pass over an edge-extended copy of
+        the image. As in ``astropy.convolution.convolve``, NaN values
+        are ignored when averaging over the neighbors.
         """
-        # Pixel weights, excluding central pixel.
-        w = np.array([
-            [1, 1, 1],
-            [1, 0, 1],
-            [1, 1, 1]], dtype=np.float64)
-        w = w / np.sum(w)
+        ny, nx = image.shape
+        padded = np.pad(np.float64(image), 1, mode='edge')
+        valid = ~np.isnan(padded)
+        padded[~valid] = 0.0
+
+        # Sum over the 8 neighbors, excluding the central pixel.
+        local_sum = np.zeros((ny, nx), dtype=np.float64)
+        local_sum2 = np.zeros((ny, nx), dtype=np.float64)
+        num_valid = np.zeros((ny, nx), dtype=np.float64)
+        for i in range(3):
+            for j in range(3):
+                if i == 1 and j == 1:
+                    continue
+                neighbors = padded[i:i+ny, j:j+nx]
+                local_sum += neighbors
+                local_sum2 += neighbors**2
+                num_valid += valid[i:i+ny, j:j+nx]
 
         # Use the fact that var(x) = <x^2> - <x>^2.
-        local_mean = convolve(image, w, boundary='extend',
-                              normalize_kernel=False)
-        local_mean2 = convolve(image**2, w, boundary='extend',
-                               normalize_kernel=False)
-        local_std = np.sqrt(local_mean2 - local_mean**2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            local_mean = local_sum / num_valid
+            local_std = np.sqrt(local_sum2 / num_valid - local_mean**2)
 
-        # Get "bad pixels"
-        badpixels = (np.abs(image - local_mean)
-                     > self._n_sigma_outlier * local_std)
+            # Get "bad pixels"
+            badpixels = (np.abs(image - local_mean)
+                         > self._n_sigma_outlier * local_std)
 
         return badpixels
 
@@ -624,22 +1115,26 @@ class SourceMorphology(object):
             _quantity_names = _quantity_names_all
 
         for q in _quantity_names:
-            tmp = self[q]
+            getattr(self, q)
+
+        # The curves of growth are only needed while measuring the
+        # quantities above, so release their stamp-sized arrays.
+        self._curves_of_growth.clear()
 
     def _check_segmaps(self):
         """
         Compare Gini segmap and MID segmap; set flag=1 if they are
         very different from each other.
         """
-        area_max = max(np.sum(self._segmap_gini),
-                       np.sum(self._segmap_mid))
-        area_overlap = np.sum(self._segmap_gini
-                              & self._segmap_mid)
+        area_max = max(np.count_nonzero(self._segmap_gini),
+                       np.count_nonzero(self._segmap_mid))
         if area_max == 0:
             warnings.warn('Segmaps are empty!', AstropyUserWarning)
             self.flag = 1
             return
 
+        area_overlap = np.count_nonzero(
+            np.logical_and(self._segmap_gini, self._segmap_mid))
         area_ratio = area_overlap / float(area_max)
         if area_ratio < self._segmap_overlap_ratio:
             warnings.warn('Gini and MID segmaps are quite different.',
@@ -730,9 +1225,17 @@ class SourceMorphology(object):
         matrix, which correspond to the *squared* semimajor and
         semiminor axes. Note that we allow negative eigenvalues.
         """
-        eigvals = np.linalg.eigvals(covariance)
+        # Closed-form eigenvalues of a symmetric 2x2 matrix. The one
+        # with the largest absolute value is calculated first, and the
+        # other one from the determinant, which avoids cancellation.
+        x2, xy, xy, y2 = covariance.flat
+        mean = 0.5 * (x2 + y2)
+        disc = np.hypot(0.5 * (x2 - y2), xy)
+        lambda1 = mean + disc if mean >= 0 else mean - disc
+        lambda2 = (x2*y2 - xy**2) / lambda1
+
         # largest first (by abs. value)
-        eigvals = np.sort(np.abs(eigvals))[::-1]
+        eigvals = np.sort(np.abs([lambda1, lambda2]))[::-1]
 
         # We deal with negative eigenvalues, but we indicate that something
         # is not OK with the data (eigenvalues cannot be exactly zero after
@@ -893,9 +1396,11 @@ class SourceMorphology(object):
         """
         Flag any NaN or inf values within the postage stamp.
         """
-        locs_invalid = ~np.isfinite(self._image[self._slice_stamp])
+        # Combine the finite values first and invert only once, in place.
+        locs_invalid = np.isfinite(self._image[self._slice_stamp])
         if self._weightmap is not None:
-            locs_invalid |= ~np.isfinite(self._weightmap[self._slice_stamp])
+            locs_invalid &= np.isfinite(self._weightmap[self._slice_stamp])
+        np.logical_not(locs_invalid, out=locs_invalid)
         return locs_invalid
 
     @lazyproperty
@@ -904,10 +1409,10 @@ class SourceMorphology(object):
         Flag badpixels (outliers).
         """
         self.num_badpixels = -1
-        badpixels = np.zeros((self.ny_stamp, self.nx_stamp), dtype=np.bool8)
+        badpixels = np.zeros((self.ny_stamp, self.nx_stamp), dtype=bool)
         if self._n_sigma_outlier > 0:
             badpixels = self._get_badpixels(self._image[self._slice_stamp])
-            self.num_badpixels = np.sum(badpixels)
+            self.num_badpixels = np.count_nonzero(badpixels)
         return badpixels
 
     @lazyproperty
@@ -919,20 +1424,44 @@ class SourceMorphology(object):
         but the background (segmap == 0) is left alone.
         """
         segmap_stamp = self._segmap.data[self._slice_stamp]
-        mask_stamp = (segmap_stamp != 0) & (segmap_stamp != self.label)
+        mask_stamp = segmap_stamp != 0
+        mask_stamp &= segmap_stamp != self.label
         if self._mask is not None:
             mask_stamp |= self._mask[self._slice_stamp]
         mask_stamp |= self._mask_stamp_nan
         mask_stamp |= self._mask_stamp_badpixels
         return mask_stamp
 
+    @lazyproperty
+    def _slice_stamp_no_bg(self):
+        """
+        The minimal bounding box (relative to the "postage stamp")
+        containing the pixels that are not masked by ``_mask_stamp_no_bg``.
+        """
+        slices = ndi.find_objects(np.int8(~self._mask_stamp_no_bg))
+        if len(slices) == 0:
+            ny, nx = self._mask_stamp_no_bg.shape
+            return (slice(0, ny), slice(0, nx))
+        return slices[0]
+
+    @lazyproperty
+    def _mask_stamp_flipped(self):
+        """
+        The "postage stamp" mask flipped along both axes, ready to be
+        shifted when rotating it by 180 degrees around different centers
+        (see ``_rotate_180_nearest``).
+        """
+        return self._mask_stamp[::-1, ::-1]
+
     @lazyproperty
     def _mask_stamp_no_bg(self):
         """
         Similar to ``_mask_stamp``, but also mask the background.
         """
         segmap_stamp = self._segmap.data[self._slice_stamp]
-        return self._mask_stamp | (segmap_stamp == 0)
+        mask_stamp_no_bg = segmap_stamp == 0
+        mask_stamp_no_bg |= self._mask_stamp
+        return mask_stamp_no_bg
 
     @lazyproperty
     def _cutout_stamp_maskzeroed(self):
@@ -981,7 +1510,11 @@ class SourceMorphology(object):
         The sorted pixel values of the (zero-masked) postage stamp,
         excluding masked values and the background.
         """
-        return np.sort(self._cutout_stamp_maskzeroed[~self._mask_stamp_no_bg])
+        # Boolean indexing returns a copy, which can be sorted in place.
+        sorted_pixelvals = self._cutout_stamp_maskzeroed_no_bg[
+            ~self._mask_stamp_no_bg]
+        sorted_pixelvals.sort()
+        return sorted_pixelvals
 
     @lazyproperty
     def _cutout_stamp_maskzeroed_no_bg_nonnegative(self):
@@ -989,8 +1522,7 @@ class SourceMorphology(object):
         Same as ``_cutout_stamp_maskzeroed_no_bg``, but masking
         negative pixels.
         """
-        image = self._cutout_stamp_maskzeroed_no_bg
-        return np.where(image > 0, image, 0.0)
+        return np.maximum(self._cutout_stamp_maskzeroed_no_bg, 0.0)
 
     @lazyproperty
     def _sorted_pixelvals_stamp_no_bg_nonnegative(self):
@@ -998,8 +1530,9 @@ class SourceMorphology(object):
         Same as ``_sorted_pixelvals_stamp_no_bg``, but masking
         negative pixels.
         """
-        image = self._cutout_stamp_maskzeroed_no_bg_nonnegative
-        return np.sort(image[~self._mask_stamp_no_bg])
+        # Setting negative values to zero preserves the order,
+        # so there is no need to sort again.
+        return np.maximum(self._sorted_pixelvals_stamp_no_bg, 0.0)
 
     @lazyproperty
     def _diagonal_distance(self):
@@ -1010,41 +1543,77 @@ class SourceMorphology(object):
         ny, nx = self._cutout_stamp_maskzeroed.shape
         return np.sqrt(nx**2 + ny**2)
 
-    def _petrosian_function_circ(self, r, center):
+    @lazyproperty
+    def _curves_of_growth(self):
         """
-        Helper function to calculate the circular Petrosian radius.
-
-        For a given radius ``r``, return the ratio of the mean flux
-        over a circular annulus divided by the mean flux within the
-        circle, minus "eta" (eq. 4 from Lotz et al. 2004). The root
-        of this function is the Petrosian radius.
+        Cache of ``_CurveOfGrowthCirc`` and ``_CurveOfGrowthEllip``
+        objects for the zero-masked postage stamp, indexed by the
+        (x, y) center and, for ellipses, the elongation and orientation.
         """
-        image = self._cutout_stamp_maskzeroed
+        return {}
 
-        r_in = r - 0.5 * self._annulus_width
-        r_out = r + 0.5 * self._annulus_width
-
-        circ_annulus = photutils.CircularAnnulus(center, r_in, r_out)
-        circ_aperture = photutils.CircularAperture(center, r)
+    def _curve_of_growth_circ(self, center):
+        """
+        Return the (cached) curve of growth of the zero-masked postage
+        stamp around ``center``.
+        """
+        key = (float(center[0]), float(center[1]))
+        if key not in self._curves_of_growth:
+            self._curves_of_growth[key] = _CurveOfGrowthCirc(
+                self._cutout_stamp_maskzeroed, key)
+        return self._curves_of_growth[key]
 
-        # Force mean fluxes to be positive:
-        circ_annulus_mean_flux = np.abs(_aperture_mean_nomask(
-            circ_annulus, image, method='exact'))
-        circ_aperture_mean_flux = np.abs(_aperture_mean_nomask(
-            circ_aperture, image, method='exact'))
+    def _curve_of_growth_ellip(self, center, elongation, theta):
+        """
+        Return the (cached) curve of growth of the zero-masked postage
+        stamp for ellipses around ``center`` with the given elongation
+        and orientation.
+        """
+        key = (float(center[0]), float(center[1]),
+               float(elongation), float(theta))
+        if key not in self._curves_of_growth:
+            self._curves_of_growth[key] = _CurveOfGrowthEllip(
+                self._cutout_stamp_maskzeroed, key[:2], key[2], key[3])
+        return self._curves_of_growth[key]
 
-        if circ_aperture_mean_flux == 0:
-            warnings.warn('[rpetro_circ] Mean flux is zero.',
+    def _petrosian_ratio(self, annulus_mean_flux, aperture_mean_flux, tag):
+        """
+        Return the ratio of the mean flux over an annulus divided by
+        the mean flux within the corresponding aperture, minus "eta"
+        (eq. 4 from Lotz et al. 2004), dealing with the case in which
+        the mean flux within the aperture is zero.
+        """
+        if aperture_mean_flux == 0:
+            warnings.warn('[%s] Mean flux is zero.' % (tag,),
                           AstropyUserWarning)
             # If flux within annulus is also zero (e.g. beyond the image
             # boundaries), return zero. Otherwise return 1.0:
-            ratio = float(circ_annulus_mean_flux != 0)
+            ratio = float(annulus_mean_flux != 0)
             self.flag = 1
         else:
-            ratio = circ_annulus_mean_flux / circ_aperture_mean_flux
+            ratio = annulus_mean_flux / aperture_mean_flux
 
         return ratio - self._eta
 
+    def _petrosian_function(self, a_values, curve_of_growth, annulus_width,
+                            elongation, tag):
+        """
+        Helper function to calculate the Petrosian "radius".
+
+        For an array of circles or ellipses with semimajor axes
+        ``a_values``, return the ratio of the mean flux over an annulus
+        divided by the mean flux within the circle or ellipse, minus
+        "eta" (eq. 4 from Lotz et al. 2004). The root of this function
+        is the Petrosian "radius".
+        """
+        annulus_mean_flux, aperture_mean_flux = _petrosian_mean_fluxes(
+            curve_of_growth, a_values, annulus_width, elongation)
+
+        return np.array([
+            self._petrosian_ratio(f_annulus, f_aperture, tag)
+            for f_annulus, f_aperture in zip(
+                annulus_mean_flux, aperture_mean_flux)])
+
     def _rpetro_circ_generic(self, center):
         """
         Compute the Petrosian radius for concentric circular apertures.
@@ -1059,42 +1628,61 @@ class SourceMorphology(object):
         brute-force search for an appropriate interval (that
         contains a root), and then we apply the root-finder.
 
+        The brute-force search evaluates the mean fluxes over
+        blocks of ``nblock`` radii at a time, which avoids
+        computing the (expensive) photometry of large apertures
+        when the interval is found close to the center.
+
         """
+        curve_of_growth = self._curve_of_growth_circ(center)
+        annulus_width = self._annulus_width
+
         # Find appropriate range for root finder
         npoints = 100
-        r_inner = self._annulus_width
+        nblock = 10
+        r_inner = annulus_width
         r_outer = self._diagonal_distance
         assert r_inner < r_outer
         dr = (r_outer - r_inner) / float(npoints-1)
         r_min, r_max = None, None
-        r = r_inner  # initial value
-        while True:
-            if r >= r_outer:
-                warnings.warn('[rpetro_circ] rpetro larger than cutout.',
-                              AstropyUserWarning)
-                self.flag = 1
-            curval = self._petrosian_function_circ(r, center)
-            if curval >= 0:
-                r_min = r
-            elif curval < 0:
-                if r_min is None:
-                    warnings.warn('[rpetro_circ] r_min is not defined yet.',
+        k = 0  # initial grid position
+        while r_max is None:
+            r_block = r_inner + dr * np.arange(k, k + nblock)
+            annulus_mean_flux, aperture_mean_flux = _petrosian_mean_fluxes(
+                curve_of_growth, r_block, annulus_width)
+            for i, r in enumerate(r_block):
+                if r >= r_outer:
+                    warnings.warn('[rpetro_circ] rpetro larger than cutout.',
                                   AstropyUserWarning)
                     self.flag = 1
-                    if r >= r_outer:
-                        # If r_min is still undefined at this point, then
-                        # rpetro must be smaller than the annulus width.
-                        warnings.warn('rpetro_circ < annulus_width! '
-                                      + 'Setting rpetro_circ = annulus_width.',
-                                      AstropyUserWarning)
-                        return r_inner
-                else:
-                    r_max = r
-                    break
-            r += dr
-
-        rpetro_circ = opt.brentq(self._petrosian_function_circ,
-                                 r_min, r_max, args=(center,), xtol=1e-6)
+                curval = self._petrosian_ratio(
+                    annulus_mean_flux[i], aperture_mean_flux[i],
+                    'rpetro_circ')
+                if curval >= 0:
+                    r_min = r
+                elif curval < 0:
+                    if r_min is None:
+                        warnings.warn(
+                            '[rpetro_circ] r_min is not defined yet.',
+                            AstropyUserWarning)
+                        self.flag = 1
+                        if r >= r_outer:
+                            # If r_min is still undefined at this point, then
+                            # rpetro must be smaller than the annulus width.
+                            warnings.warn(
+                                'rpetro_circ < annulus_width! '
+                                + 'Setting rpetro_circ = annulus_width.',
+                                AstropyUserWarning)
+                            return r_inner
+                    else:
+                        r_max = r
+                        break
+            k += nblock
+
+        rpetro_circ = _chandrupatla(
+            lambda r: self._petrosian_function(
+                r, curve_of_growth, annulus_width, 1.0, 'rpetro_circ'),
+            r_min, r_max, xtol=1e-6)
 
         return rpetro_circ
 
@@ -1130,48 +1718,6 @@ class SourceMorphology(object):
         ap_sum = np.abs(ap.do_photometry(image, method='exact')[0][0])
         return ap_sum
 
-    def _petrosian_function_ellip(self, a, center, elongation, theta):
-        """
-        Helper function to calculate the Petrosian "radius".
-
-        For the ellipse with semi-major axis ``a``, return the
-        ratio of the mean flux over an elliptical annulus
-        divided by the mean flux within the ellipse,
-        minus "eta" (eq. 4 from Lotz et al. 2004). The root of
-        this function is the Petrosian "radius".
-
-        """
-        image = self._cutout_stamp_maskzeroed
-
-        b = a / elongation
-        a_in = a - 0.5 * self._annulus_width
-        a_out = a + 0.5 * self._annulus_width
-
-        b_out = a_out / elongation
-
-        ellip_annulus = photutils.EllipticalAnnulus(
-            center, a_in, a_out, b_out, theta=theta)
-        ellip_aperture = photutils.EllipticalAperture(
-            center, a, b, theta=theta)
-
-        # Force mean fluxes to be positive:
-        ellip_annulus_mean_flux = np.abs(_aperture_mean_nomask(
-            ellip_annulus, image, method='exact'))
-        ellip_aperture_mean_flux = np.abs(_aperture_mean_nomask(
-            ellip_aperture, image, method='exact'))
-
-        if ellip_aperture_mean_flux == 0:
-            warnings.warn('[rpetro_ellip] Mean flux is zero.',
-                          AstropyUserWarning)
-            # If flux within annulus is also zero (e.g. beyond the image
-            # boundaries), return zero. Otherwise return 1.0:
-            ratio = float(ellip_annulus_mean_flux != 0)
-            self.flag = 1
-        else:
-            ratio = ellip_annulus_mean_flux / ellip_aperture_mean_flux
-
-        return ratio - self._eta
-
     def _rpetro_ellip_generic(self, center, elongation, theta):
         """
         Compute the Petrosian "radius" (actually the semi-major axis)
@@ -1188,42 +1734,56 @@ class SourceMorphology(object):
         contains a root), and then we apply the root-finder.
 
         """
+        curve_of_growth = self._curve_of_growth_ellip(
+            center, elongation, theta)
+        annulus_width = self._annulus_width
+
         # Find appropriate range for root finder
         npoints = 100
-        a_inner = self._annulus_width
+        nblock = 10
+        a_inner = annulus_width
         a_outer = self._diagonal_distance
         assert a_inner < a_outer
         da = (a_outer - a_inner) / float(npoints-1)
         a_min, a_max = None, None
-        a = a_inner  # initial value
-        while True:
-            if a >= a_outer:
-                warnings.warn('[rpetro_ellip] rpetro larger than cutout.',
-                              AstropyUserWarning)
-                self.flag = 1
-            curval = self._petrosian_function_ellip(
-                a, center, elongation, theta)
-            if curval >= 0:
-                a_min = a
-            elif curval < 0:
-                if a_min is None:
-                    warnings.warn('[rpetro_ellip] a_min is not defined yet.',
+        k = 0  # initial grid position
+        while a_max is None:
+            a_block = a_inner + da * np.arange(k, k + nblock)
+            annulus_mean_flux, aperture_mean_flux = _petrosian_mean_fluxes(
+                curve_of_growth, a_block, annulus_width, elongation)
+            for i, a in enumerate(a_block):
+                if a >= a_outer:
+                    warnings.warn('[rpetro_ellip] rpetro larger than cutout.',
                                   AstropyUserWarning)
                     self.flag = 1
-                    if a >= a_outer:
-                        # If a_min is still undefined at this point, then
-                        # rpetro must be smaller than the annulus width.
-                        warnings.warn('rpetro_ellip < annulus_width! '
-                                      + 'Setting rpetro_ellip = annulus_width.',
-                                      AstropyUserWarning)
-                        return a_inner
-                else:
-                    a_max = a
-                    break
-            a += da
-
-        rpetro_ellip = opt.brentq(self._petrosian_function_ellip, a_min, a_max,
-                                  args=(center, elongation, theta,), xtol=1e-6)
+                curval = self._petrosian_ratio(
+                    annulus_mean_flux[i], aperture_mean_flux[i],
+                    'rpetro_ellip')
+                if curval >= 0:
+                    a_min = a
+                elif curval < 0:
+                    if a_min is None:
+                        warnings.warn(
+                            '[rpetro_ellip] a_min is not defined yet.',
+                            AstropyUserWarning)
+                        self.flag = 1
+                        if a >= a_outer:
+                            # If a_min is still undefined at this point, then
+                            # rpetro must be smaller than the annulus width.
+                            warnings.warn(
+                                'rpetro_ellip < annulus_width! '
+                                + 'Setting rpetro_ellip = annulus_width.',
+                                AstropyUserWarning)
+                            return a_inner
+                    else:
+                        a_max = a
+                        break
+            k += nblock
+
+        rpetro_ellip = _chandrupatla(
+            lambda a: self._petrosian_function(
+                a, curve_of_growth, annulus_width, elongation, 'rpetro_ellip'),
+            a_min, a_max, xtol=1e-6)
 
         return rpetro_ellip
 
@@ -1266,28 +1826,24 @@ class SourceMorphology(object):
         """
         # Smooth image
         petro_sigma = self._petro_fraction_gini * self.rpetro_ellip
-        cutout_smooth = ndi.gaussian_filter(
+        cutout_smooth = _gaussian_filter(
             self._cutout_stamp_maskzeroed, petro_sigma)
 
         # Use mean flux at the Petrosian "radius" as threshold
         a_in = self.rpetro_ellip - 0.5 * self._annulus_width
         a_out = self.rpetro_ellip + 0.5 * self._annulus_width
-        b_out = a_out / self.elongation_asymmetry
-        theta = self.orientation_asymmetry
-        ellip_annulus = photutils.EllipticalAnnulus(
-            (self._xc_stamp, self._yc_stamp), a_in, a_out, b_out, theta=theta)
-        ellip_annulus_mean_flux = _aperture_mean_nomask(
-            ellip_annulus, cutout_smooth, method='exact')
+        elongation = self.elongation_asymmetry
+        ellip_annulus_flux = _elliptical_annulus_flux(
+            cutout_smooth, (self._xc_stamp, self._yc_stamp), a_in, a_out,
+            elongation, self.orientation_asymmetry)
+        ellip_annulus_mean_flux = ellip_annulus_flux / (
+            np.pi * (a_out**2 - a_in**2) / elongation)
 
         above_threshold = cutout_smooth >= ellip_annulus_mean_flux
 
-        # Grow regions with 8-connected neighbor "footprint"
-        s = ndi.generate_binary_structure(2, 2)
-        labeled_array, num_features = ndi.label(above_threshold, structure=s)
-
         # In some rare cases (e.g., Pan-STARRS J020218.5+672123_g.fits.gz),
         # this results in an empty segmap, so there is nothing to do.
-        if num_features == 0:
+        if not np.any(above_threshold):
             warnings.warn('[segmap_gini] Empty Gini segmap!',
                           AstropyUserWarning)
             self.flag = 1
@@ -1295,21 +1851,26 @@ class SourceMorphology(object):
 
         # In other cases (e.g., object 110 from CANDELS/GOODS-S WFC/F160W),
         # the Gini segmap occupies the entire image, which is also not OK.
-        if np.sum(above_threshold) == cutout_smooth.size:
+        if np.all(above_threshold):
             warnings.warn('[segmap_gini] Full Gini segmap!',
                           AstropyUserWarning)
             self.flag = 1
             return above_threshold
 
-        # If more than one region, activate the "bad measurement" flag
-        # and only keep segment that contains the brightest pixel.
-        if num_features > 1:
+        # Only keep the segment that contains the brightest pixel, grown
+        # with an 8-connected neighbor "footprint". There is no need to
+        # label all the other segments: if this one does not contain all
+        # the pixels above the threshold, there is more than one region,
+        # so we activate the "bad measurement" flag.
+        ic, jc = np.unravel_index(np.argmax(cutout_smooth),
+                                  cutout_smooth.shape)
+        assert above_threshold[ic, jc]
+        segmap = skimage.segmentation.flood(
+            above_threshold, (ic, jc), connectivity=2)
+        if np.count_nonzero(segmap) < np.count_nonzero(above_threshold):
             warnings.warn('[segmap_gini] Disjoint features in Gini segmap.',
                           AstropyUserWarning)
             self.flag = 1
-            ic, jc = np.argwhere(cutout_smooth == np.max(cutout_smooth))[0]
-            assert labeled_array[ic, jc] != 0
-            segmap = labeled_array == labeled_array[ic, jc]
         else:
             segmap = above_threshold
 
@@ -1320,21 +1881,23 @@ class SourceMorphology(object):
         """
         Calculate the Gini coefficient as described in Lotz et al. (2004).
         """
-        image = self._cutout_stamp_maskzeroed.flatten()
-        segmap = self._segmap_gini.flatten()
+        # Boolean indexing already returns a copy, which can be
+        # modified and sorted in place.
+        sorted_pixelvals = self._cutout_stamp_maskzeroed[self._segmap_gini]
+        np.abs(sorted_pixelvals, out=sorted_pixelvals)
+        sorted_pixelvals.sort()
 
-        sorted_pixelvals = np.sort(np.abs(image[segmap]))
         n = len(sorted_pixelvals)
-        if n <= 1 or np.sum(sorted_pixelvals) == 0:
+        total_sum = np.sum(sorted_pixelvals)
+        if n <= 1 or total_sum == 0:
             warnings.warn('[gini] Not enough data for Gini calculation.',
                           AstropyUserWarning)
 
             self.flag = 1
             return -99.0  # invalid
 
-        indices = np.arange(1, n+1)  # start at i=1
-        gini = (np.sum((2*indices-n-1) * sorted_pixelvals)
-                / (float(n-1) * np.sum(sorted_pixelvals)))
+        weights = 2.0*np.arange(1, n+1) - n - 1  # start at i=1
+        gini = np.dot(weights, sorted_pixelvals) / (float(n-1) * total_sum)
 
         return gini
 
@@ -1343,30 +1906,52 @@ class SourceMorphology(object):
         """
         Calculate the M_20 coefficient as described in Lotz et al. (2004).
         """
-        if np.sum(self._segmap_gini) == 0:
+        if not np.any(self._segmap_gini):
             return -99.0  # invalid
 
-        # Use the same region as in the Gini calculation
-        image = np.where(self._segmap_gini, self._cutout_stamp_maskzeroed, 0.0)
-        image = np.float64(image)  # skimage wants double
+        # Use the same region as in the Gini calculation. Only the
+        # pixels within the segmap contribute to the moments, so we
+        # work with their values and positions directly. The values
+        # are kept (and sorted) in their original precision, but all
+        # sums are calculated in double precision.
+        yy, xx = np.nonzero(self._segmap_gini)
+        pixelvals = self._cutout_stamp_maskzeroed[yy, xx]
 
         # Calculate centroid
-        M = skimage.measure.moments(image, order=1)
-        if M[0, 0] <= 0:
+        m00 = np.sum(pixelvals, dtype=np.float64)
+        if m00 <= 0:
             warnings.warn('[deviation] Nonpositive flux within Gini segmap.',
                           AstropyUserWarning)
             self.flag = 1
             return -99.0  # invalid
-        yc = M[1, 0] / M[0, 0]
-        xc = M[0, 1] / M[0, 0]
+        yc = np.dot(pixelvals, yy) / m00
+        xc = np.dot(pixelvals, xx) / m00
 
         # Calculate second total central moment
-        Mc = skimage.measure.moments_central(image, center=(yc, xc), order=2)
-        second_moment_tot = Mc[0, 2] + Mc[2, 0]
-
-        # Calculate threshold pixel value
-        sorted_pixelvals = np.sort(image.flatten())
-        flux_fraction = np.cumsum(sorted_pixelvals) / np.sum(sorted_pixelvals)
+        distances_sq = (xx - xc)**2 + (yy - yc)**2
+        second_moment_tot = np.dot(pixelvals, distances_sq)
+
+        # Calculate threshold pixel value. Only the brightest pixels
+        # need to be sorted, so we partition the pixel values and sort
+        # the brightest k of them, doubling k until the cumulative
+        # flux fraction crosses 0.8 within the sorted part. Since
+        # m00 > 0, the cumulative sum (in ascending order) cannot
+        # cross this value before any of its later elements.
+        npixels = len(pixelvals)
+        k = max(npixels // 5, 1)
+        while True:
+            if k >= npixels:
+                sorted_pixelvals = np.sort(pixelvals)
+                lower_sum = 0.0
+            else:
+                partitioned = np.partition(pixelvals, npixels - k)
+                sorted_pixelvals = np.sort(partitioned[npixels-k:])
+                lower_sum = np.sum(partitioned[:npixels-k], dtype=np.float64)
+            cumulative_sum = np.cumsum(sorted_pixelvals, dtype=np.float64)
+            flux_fraction = (lower_sum + cumulative_sum) / m00
+            if k >= npixels or flux_fraction[0] < 0.8:
+                break
+            k *= 2
         sorted_pixelvals_20 = sorted_pixelvals[flux_fraction >= 0.8]
         if len(sorted_pixelvals_20) == 0:
             # This can happen when there are very few pixels.
@@ -1377,10 +1962,8 @@ class SourceMorphology(object):
         threshold = sorted_pixelvals_20[0]
 
         # Calculate second moment of the brightest pixels
-        image_20 = np.where(image >= threshold, image, 0.0)
-        Mc_20 = skimage.measure.moments_central(
-            image_20, center=(yc, xc), order=2)
-        second_moment_20 = Mc_20[0, 2] + Mc_20[2, 0]
+        locs_20 = pixelvals >= threshold
+        second_moment_20 = np.dot(pixelvals[locs_20], distances_sq[locs_20])
 
         if (second_moment_20 <= 0) | (second_moment_tot <= 0):
             warnings.warn('[m20] Negative second moment(s).',
@@ -1450,7 +2033,7 @@ class SourceMorphology(object):
 
         locs = (self._segmap_gini & (self._cutout_stamp_maskzeroed >= 0)
                 & (weightmap > 0))
-        if np.sum(locs) == 0:
+        if not np.any(locs):
             warnings.warn('Invalid sn_per_pixel.', AstropyUserWarning)
             self.flag = 1
             snp = -99.0  # invalid
@@ -1470,12 +2053,9 @@ class SourceMorphology(object):
         '''
         Get the mask of the target and the others.
         '''
-        mask_targ = self._segmap.data != 0
-
-        if self._mask is None:
-            mask = mask_targ
-        else:
-            mask = mask_targ | self._mask
+        mask = self._segmap.data != 0
+        if self._mask is not None:
+            mask |= self._mask
         return mask
 
     def _cutout_random(self):
@@ -1517,7 +2097,7 @@ class SourceMorphology(object):
             counter += 1
             cutslice = self._cutout_random()
             mask_cut = mask[cutslice]
-            mask_fraction = np.sum(mask_cut) / \
+            mask_fraction = np.count_nonzero(mask_cut) / \
                 (mask_cut.shape[0] * mask_cut.shape[1])
             bkg = self._image[cutslice]
             if np.isnan(bkg).any():
@@ -1530,7 +2110,8 @@ class SourceMorphology(object):
 
         bkg_180 = bkg[::-1, ::-1]
         mask_tot = ~(mask_cut | mask_cut[::-1, ::-1])
-        a_sky = np.sum(np.abs(bkg_180 - bkg)[mask_tot]) / np.sum(mask_tot)
+        a_sky = (np.sum(np.abs(bkg_180 - bkg)[mask_tot]) /
+                 np.count_nonzero(mask_tot))
         return a_sky
 
     def _sky_asymmetry_sample_function(self, nsample=100, quantile=0.15, mask_fraction_limit=0.1, maxiter=100):
@@ -1588,22 +2169,39 @@ class SourceMorphology(object):
 
         In principle, a more accurate approach is possible
         (e.g. Shi et al. 2009, ApJ, 697, 1764).
+
+        Notes
+        -----
+        The number of "bad" (segmented or masked) pixels within every
+        candidate box is obtained at once from a summed-area table
+        (integral image), and the first box without bad pixels is
+        returned, scanning in the same (row-major) order as before.
         """
         segmap = self._segmap.data[self._slice_stamp]
         ny, nx = segmap.shape
-        mask = np.zeros(segmap.shape, dtype=np.bool8)
+        bad = segmap != 0
         if self._mask is not None:
-            mask = self._mask[self._slice_stamp]
+            bad |= self._mask[self._slice_stamp]
+
+        # Summed-area table, such that table[i, j] = bad[:i, :j].sum()
+        table = np.zeros((ny + 1, nx + 1), dtype=np.int64)
+        np.cumsum(bad, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
 
         assert self._skybox_size >= 2
         cur_skybox_size = self._skybox_size
         while True:
-            for i in range(0, ny - cur_skybox_size):
-                for j in range(0, nx - cur_skybox_size):
-                    boxslice = (slice(i, i + cur_skybox_size),
-                                slice(j, j + cur_skybox_size))
-                    if np.all(segmap[boxslice] == 0) and np.all(~mask[boxslice]):
-                        return boxslice
+            s = cur_skybox_size
+            if ny > s and nx > s:
+                # Number of bad pixels in the boxes starting at (i, j),
+                # with 0 <= i < ny - s and 0 <= j < nx - s:
+                box_sums = (table[s:ny, s:nx] - table[0:ny-s, s:nx]
+                            - table[s:ny, 0:nx-s] + table[0:ny-s, 0:nx-s])
+                locs = np.flatnonzero(box_sums == 0)
+                if len(locs) > 0:
+                    i, j = np.unravel_index(locs[0], box_sums.shape)
+                    i, j = int(i), int(j)
+                    return (slice(i, i + s), slice(j, j + s))
 
             # If we got here, a skybox of the given size was not found.
             if cur_skybox_size <= 2:
@@ -1617,28 +2215,43 @@ class SourceMorphology(object):
                                   cur_skybox_size), AstropyUserWarning)
 
     @lazyproperty
-    def sky_mean(self):
+    def _sky_bkg(self):
         """
-        Mean background value. Equal to -99.0 when there is no skybox.
+        The region of the zero-masked postage stamp within the skybox.
+        """
+        return self._cutout_stamp_maskzeroed[self._slice_skybox]
+
+    @lazyproperty
+    def _sky_stats(self):
         """
-        bkg = self._cutout_stamp_maskzeroed[self._slice_skybox]
+        Return the mean, median, standard deviation and asymmetry of
+        the background, all calculated from the same skybox cutout.
+        Each of them is equal to -99.0 when there is no skybox.
+        """
+        bkg = self._sky_bkg
         if bkg.size == 0:
             assert self.flag == 1
-            return -99.0
+            return -99.0, -99.0, -99.0, -99.0
 
-        return np.mean(bkg)
+        bkg_diff = bkg[::-1, ::-1] - bkg
+        np.abs(bkg_diff, out=bkg_diff)
+        sky_asymmetry = np.sum(bkg_diff) / float(bkg.size)
+
+        return np.mean(bkg), np.median(bkg), np.std(bkg), sky_asymmetry
+
+    @lazyproperty
+    def sky_mean(self):
+        """
+        Mean background value. Equal to -99.0 when there is no skybox.
+        """
+        return self._sky_stats[0]
 
     @lazyproperty
     def sky_median(self):
         """
         Median background value. Equal to -99.0 when there is no skybox.
         """
-        bkg = self._cutout_stamp_maskzeroed[self._slice_skybox]
-        if bkg.size == 0:
-            assert self.flag == 1
-            return -99.0
-
-        return np.median(bkg)
+        return self._sky_stats[1]
 
     @lazyproperty
     def sky_sigma(self):
@@ -1646,12 +2259,7 @@ class SourceMorphology(object):
         Standard deviation of the background. Equal to -99.0 when there
         is no skybox.
         """
-        bkg = self._cutout_stamp_maskzeroed[self._slice_skybox]
-        if bkg.size == 0:
-            assert self.flag == 1
-            return -99.0
-
-        return np.std(bkg)
+        return self._sky_stats[2]
 
     @lazyproperty
     def _sky_asymmetry(self):
@@ -1659,13 +2267,7 @@ class SourceMorphology(object):
         Asymmetry of the background. Equal to -99.0 when there is no
         skybox. Note the peculiar normalization (for reference only).
         """
-        bkg = self._cutout_stamp_maskzeroed[self._slice_skybox]
-        bkg_180 = bkg[::-1, ::-1]
-        if bkg.size == 0:
-            assert self.flag == 1
-            return -99.0
-
-        return np.sum(np.abs(bkg_180 - bkg)) / float(bkg.size)
+        return self._sky_stats[3]
 
     @lazyproperty
     def _sky_smoothness(self):
@@ -1673,7 +2275,7 @@ class SourceMorphology(object):
         Smoothness of the background. Equal to -99.0 when there is no
         skybox. Note the peculiar normalization (for reference only).
         """
-        bkg = self._cutout_stamp_maskzeroed[self._slice_skybox]
+        bkg = self._sky_bkg
         if bkg.size == 0:
             assert self.flag == 1
             return -99.0
@@ -1708,7 +2310,6 @@ class SourceMorphology(object):
         asym : The asymmetry statistic for the given center.
 
         """
-        image = np.float64(image)  # skimage wants double
         ny, nx = image.shape
         xc, yc = center
 
@@ -1721,15 +2322,14 @@ class SourceMorphology(object):
             return 100.0
 
         # Rotate around given center
-        image_180 = skimage.transform.rotate(image, 180.0, center=center)
+        image_180 = _rotate_180(image, center)
 
         # Apply symmetric mask
-        mask = self._mask_stamp.copy()
-        mask_180 = skimage.transform.rotate(mask, 180.0, center=center)
-        mask_180 = mask_180 >= 0.5  # convert back to bool
-        mask_symmetric = mask | mask_180
+        mask_180 = _rotate_180_nearest(
+            self._mask_stamp_flipped, center, flipped=True)
+        mask_symmetric = self._mask_stamp | mask_180
         image = np.where(~mask_symmetric, image, 0.0)
-        image_180 = np.where(~mask_symmetric, image_180, 0.0)
+        image_180[mask_symmetric] = 0.0
 
         if image[int(yc), int(xc)] == 0.0:
             self.flag_maskcenter = 1
@@ -1742,7 +2342,8 @@ class SourceMorphology(object):
             ap_cas_region = ap.to_mask(method='center')
             ap_cas_region = ap_cas_region.to_image((ny, nx))
             ap_cas_overlap = np.logical_and(mask_symmetric, ap_cas_region)
-            frac_mask_cas = np.sum(ap_cas_overlap)/np.sum(ap_cas_region)
+            frac_mask_cas = (np.count_nonzero(ap_cas_overlap) /
+                             np.sum(ap_cas_region))
             self.frac_mask_cas = frac_mask_cas
         elif kind == 'outer':
             a_in = self.rhalf_ellip
@@ -1755,7 +2356,8 @@ class SourceMorphology(object):
             ap_out_region = ap.to_mask(method='center')
             ap_out_region = ap_out_region.to_image((ny, nx))
             ap_out_overlap = np.logical_and(mask_symmetric, ap_out_region)
-            frac_mask_out = np.sum(ap_out_overlap)/np.sum(ap_out_region)
+            frac_mask_out = (np.count_nonzero(ap_out_overlap) /
+                             np.sum(ap_out_region))
             self.frac_mask_out = frac_mask_out
         elif kind == 'shape':
             if np.isnan(self.rmax_circ) or (self.rmax_circ <= 0):
@@ -1767,15 +2369,21 @@ class SourceMorphology(object):
             ap_shape_region = ap.to_mask(method='center')
             ap_shape_region = ap_shape_region.to_image((ny, nx))
             ap_shape_overlap = np.logical_and(mask_symmetric, ap_shape_region)
-            frac_mask_shape = np.sum(ap_shape_overlap)/np.sum(ap_shape_region)
+            frac_mask_shape = (np.count_nonzero(ap_shape_overlap) /
+                               np.sum(ap_shape_region))
             self.frac_mask_shape = frac_mask_shape
         else:
             raise NotImplementedError('Asymmetry kind not understood:', kind)
 
-        # Apply eq. 10 from Lotz et al. (2004)
-        ap_abs_sum = ap.do_photometry(np.abs(image), method='exact')[0][0]
-        ap_abs_diff = ap.do_photometry(
-            np.abs(image_180-image), method='exact')[0][0]
+        # Apply eq. 10 from Lotz et al. (2004), also calculating
+        # the aperture area (excluding masked pixels). Both images
+        # are temporary, so their absolute values (of the residual,
+        # for the rotated one) are calculated in place.
+        np.subtract(image_180, image, out=image_180)
+        np.abs(image_180, out=image_180)
+        np.abs(image, out=image)
+        ap_abs_sum, ap_abs_diff, ap_area = _aperture_sums(
+            ap, [image, image_180, ~mask_symmetric], method='exact')
 
         if ap_abs_sum == 0.0:
             warnings.warn('[asymmetry_function] Zero flux sum.',
@@ -1791,7 +2399,6 @@ class SourceMorphology(object):
             if self._sky_asymmetry == -99.0:  # invalid skybox
                 asym = ap_abs_diff / ap_abs_sum
             else:
-                ap_area = _aperture_area(ap, mask_symmetric)
                 asym = (ap_abs_diff - ap_area*self._sky_asymmetry) / ap_abs_sum
                 if kind == 'cas':
                     self.asym_sky_cas = ap_area*self._sky_asymmetry / ap_abs_sum
@@ -1831,7 +2438,6 @@ class SourceMorphology(object):
         asym_std : The uncertainty of the asymmetry.
 
         """
-        image = np.float64(image)  # skimage wants double
         ny, nx = image.shape
         xc, yc = center
 
@@ -1844,15 +2450,14 @@ class SourceMorphology(object):
             return 100.0
 
         # Rotate around given center
-        image_180 = skimage.transform.rotate(image, 180.0, center=center)
+        image_180 = _rotate_180(image, center)
 
         # Apply symmetric mask
-        mask = self._mask_stamp.copy()
-        mask_180 = skimage.transform.rotate(mask, 180.0, center=center)
-        mask_180 = mask_180 >= 0.5  # convert back to bool
-        mask_symmetric = mask | mask_180
+        mask_180 = _rotate_180_nearest(
+            self._mask_stamp_flipped, center, flipped=True)
+        mask_symmetric = self._mask_stamp | mask_180
         image = np.where(~mask_symmetric, image, 0.0)
-        image_180 = np.where(~mask_symmetric, image_180, 0.0)
+        image_180[mask_symmetric] = 0.0
 
         if image[int(yc), int(xc)] == 0.0:
             self.flag_maskcenter = 1
@@ -1865,7 +2470,8 @@ class SourceMorphology(object):
             ap_cas_region = ap.to_mask(method='center')
             ap_cas_region = ap_cas_region.to_image((ny, nx))
             ap_cas_overlap = np.logical_and(mask_symmetric, ap_cas_region)
-            frac_mask_cas = np.sum(ap_cas_overlap)/np.sum(ap_cas_region)
+            frac_mask_cas = (np.count_nonzero(ap_cas_overlap) /
+                             np.sum(ap_cas_region))
             self.frac_mask_cas = frac_mask_cas
         elif kind == 'outer':
             a_in = self.rhalf_ellip
@@ -1878,7 +2484,8 @@ class SourceMorphology(object):
             ap_out_region = ap.to_mask(method='center')
             ap_out_region = ap_out_region.to_image((ny, nx))
             ap_out_overlap = np.logical_and(mask_symmetric, ap_out_region)
-            frac_mask_out = np.sum(ap_out_overlap)/np.sum(ap_out_region)
+            frac_mask_out = (np.count_nonzero(ap_out_overlap) /
+                             np.sum(ap_out_region))
             self.frac_mask_out = frac_mask_out
         elif kind == 'shape':
             if np.isnan(self.rmax_circ) or (self.rmax_circ <= 0):
@@ -1890,15 +2497,21 @@ class SourceMorphology(object):
             ap_shape_region = ap.to_mask(method='center')
             ap_shape_region = ap_shape_region.to_image((ny, nx))
             ap_shape_overlap = np.logical_and(mask_symmetric, ap_shape_region)
-            frac_mask_shape = np.sum(ap_shape_overlap)/np.sum(ap_shape_region)
+            frac_mask_shape = (np.count_nonzero(ap_shape_overlap) /
+                               np.sum(ap_shape_region))
             self.frac_mask_shape = frac_mask_shape
         else:
             raise NotImplementedError('Asymmetry kind not understood:', kind)
 
-        # Apply eq. 10 from Lotz et al. (2004)
-        ap_abs_sum = ap.do_photometry(np.abs(image), method='exact')[0][0]
-        ap_abs_diff = ap.do_photometry(
-            np.abs(image_180-image), method='exact')[0][0]
+        # Apply eq. 10 from Lotz et al. (2004), also calculating
+        # the aperture area (excluding masked pixels). Both images
+        # are temporary, so their absolute values (of the residual,
+        # for the rotated one) are calculated in place.
+        np.subtract(image_180, image, out=image_180)
+        np.abs(image_180, out=image_180)
+        np.abs(image, out=image)
+        ap_abs_sum, ap_abs_diff, ap_area = _aperture_sums(
+            ap, [image, image_180, ~mask_symmetric], method='exact')
 
         if ap_abs_sum == 0.0:
             warnings.warn('[asymmetry_function] Zero flux sum.',
@@ -1916,7 +2529,6 @@ class SourceMorphology(object):
                 asym_std = np.nan 
             else:
                 asky, asky_std = self._sky_asymmetry_sample
-                ap_area = _aperture_area(ap, mask_symmetric)
                 asym = (ap_abs_diff - ap_area*asky) / ap_abs_sum
                 asym_std = 2 * ap_area*asky_std / ap_abs_sum
                 if kind == 'cas':
@@ -1934,9 +2546,11 @@ class SourceMorphology(object):
         "postage stamp" cutout) that minimizes the (CAS) asymmetry.
         """
         center_0 = np.array([self._xc_stamp, self._yc_stamp])  # initial guess
-        center_asym = opt.fmin(self._asymmetry_function, center_0,
-                               args=(self._cutout_stamp_maskzeroed, 'cas'),
-                               xtol=1e-6, disp=False)
+        res = opt.minimize(self._asymmetry_function, center_0,
+                           args=(self._cutout_stamp_maskzeroed, 'cas'),
+                           method='Nelder-Mead',
+                           options={'xatol': 1e-6, 'fatol': 1e-4})
+        center_asym = res.x
 
         # Check if flag was activated by _asymmetry_function:
         if self._use_centroid:
@@ -2048,15 +2662,14 @@ class SourceMorphology(object):
 
     def _radius_at_fraction_of_total_cas(self, fraction):
         """
-        Specialization of ``_radius_at_fraction_of_total_circ`` for
+        Specialization of ``_radius_at_fraction_of_total`` for
         the CAS calculations.
         """
-        image = self._cutout_stamp_maskzeroed
-        center = self._asymmetry_center
+        curve_of_growth = self._curve_of_growth_circ(self._asymmetry_center)
         r_upper = self._petro_extent_cas * self.rpetro_circ
 
-        r, flag = _radius_at_fraction_of_total_circ(
-            image, center, r_upper, fraction)
+        r, flag = _radius_at_fraction_of_total(
+            curve_of_growth, r_upper, fraction, 'r_circ')
         self.flag = max(self.flag, flag)
 
         if np.isnan(r) or (r <= 0.0):
@@ -2123,8 +2736,8 @@ class SourceMorphology(object):
         image_diff = image - image_smooth
         image_diff[image_diff < 0] = 0.0  # set negative pixels to zero
 
-        ap_flux = ap.do_photometry(image, method='exact')[0][0]
-        ap_diff = ap.do_photometry(image_diff, method='exact')[0][0]
+        ap_flux, ap_diff = _aperture_sums(
+            ap, [image, image_diff], method='exact')
 
         if ap_flux <= 0:
             warnings.warn('[smoothness] Nonpositive total flux.',
@@ -2154,23 +2767,33 @@ class SourceMorphology(object):
         the locations of pixels above ``q`` (within the original segment)
         that are also part of the "main" clump.
         """
+        image = self._cutout_stamp_maskzeroed_no_bg_nonnegative
         threshold = _quantile(
             self._sorted_pixelvals_stamp_no_bg_nonnegative, q)
-        above_threshold = self._cutout_stamp_maskzeroed_no_bg_nonnegative >= threshold
+
+        # All the pixels above a positive threshold belong to the
+        # original segment, so only its bounding box is labeled.
+        if threshold > 0:
+            slc = self._slice_stamp_no_bg
+        else:
+            slc = (slice(0, image.shape[0]), slice(0, image.shape[1]))
+        above_threshold = image[slc] >= threshold
 
         # Instead of assuming that the main segment is at the center
         # of the stamp, use the position of the brightest pixel:
-        ic = int(np.round(self._y_maxval_stamp))
-        jc = int(np.round(self._x_maxval_stamp))
+        ic = int(np.round(self._y_maxval_stamp)) - slc[0].start
+        jc = int(np.round(self._x_maxval_stamp)) - slc[1].start
 
         # Grow regions using 8-connected neighbor "footprint"
-        s = ndi.generate_binary_structure(2, 2)
-        labeled_array, num_features = ndi.label(above_threshold, structure=s)
+        labeled_array, num_features = ndi.label(
+            above_threshold, structure=_structure_8conn)
 
         # Sanity check (brightest pixel should be part of the main clump):
         assert labeled_array[ic, jc] != 0
 
-        return labeled_array == labeled_array[ic, jc]
+        locs_main_clump = np.zeros(image.shape, dtype=bool)
+        locs_main_clump[slc] = labeled_array == labeled_array[ic, jc]
+        return locs_main_clump
 
     def _segmap_mid_function(self, q):
         """
@@ -2247,8 +2870,8 @@ class SourceMorphology(object):
             self.flag = 1
 
         # Grow regions with 8-connected neighbor "footprint"
-        s = ndi.generate_binary_structure(2, 2)
-        labeled_array, num_features = ndi.label(segmap, structure=s)
+        labeled_array, num_features = ndi.label(
+            segmap, structure=_structure_8conn)
 
         return labeled_array == labeled_array[ic, jc]
 
@@ -2262,6 +2885,19 @@ class SourceMorphology(object):
                          self._cutout_stamp_maskzeroed_no_bg_nonnegative, 0.0)
         return image
 
+    @lazyproperty
+    def _slice_mid(self):
+        """
+        The minimal bounding box (relative to the "postage stamp")
+        containing the MID segmap. Pixels of ``_cutout_mid`` outside
+        this region are equal to zero.
+        """
+        slices = ndi.find_objects(np.int8(self._segmap_mid))
+        if len(slices) == 0:
+            ny, nx = self._segmap_mid.shape
+            return (slice(0, ny), slice(0, nx))
+        return slices[0]
+
     @lazyproperty
     def _sorted_pixelvals_mid(self):
         """
@@ -2270,22 +2906,42 @@ class SourceMorphology(object):
         image = self._cutout_mid
         return np.sort(image[~self._mask_stamp_no_bg])
 
+    @lazyproperty
+    def _multimode_cache(self):
+        """
+        Cache of ``_multimode_function`` results, indexed by the
+        threshold pixel value (many quantiles map to the same one).
+        """
+        return {}
+
     def _multimode_function(self, q):
         """
         Helper function to calculate the multimode statistic.
         Returns the sorted "areas" of the clumps at quantile ``q``.
         """
         threshold = _quantile(self._sorted_pixelvals_mid, q)
-        above_threshold = self._cutout_mid >= threshold
+        key = float(threshold)
+        if key not in self._multimode_cache:
+            self._multimode_cache[key] = self._clump_areas_mid(threshold)
+        return self._multimode_cache[key]
 
-        # Neighbor "footprint" for growing regions, including corners:
-        s = ndi.generate_binary_structure(2, 2)
+    def _clump_areas_mid(self, threshold):
+        """
+        Return the sorted "areas" of the clumps (in the MID cutout)
+        above the given ``threshold``.
+        """
+        if threshold > 0:
+            # All the pixels above a positive threshold belong to
+            # the MID segmap, so only its bounding box is labeled.
+            above_threshold = self._cutout_mid[self._slice_mid] >= threshold
+        else:
+            above_threshold = self._cutout_mid >= threshold
 
-        labeled_array, num_features = ndi.label(above_threshold, structure=s)
+        labeled_array, num_features = ndi.label(
+            above_threshold, structure=_structure_8conn)
 
         # Zero is reserved for non-labeled pixels:
-        labeled_array_nonzero = labeled_array[labeled_array != 0]
-        labels, counts = np.unique(labeled_array_nonzero, return_counts=True)
+        counts = np.bincount(labeled_array.ravel())[1:]
         sorted_counts = np.sort(counts)[::-1]
 
         return sorted_counts
@@ -2401,7 +3057,7 @@ class SourceMorphology(object):
         Just a Gaussian-smoothed version of the zero-masked image used
         in the MID calculations.
         """
-        image_smooth = ndi.gaussian_filter(self._cutout_mid, self._sigma_mid)
+        image_smooth = _gaussian_filter(self._cutout_mid, self._sigma_mid)
         return image_smooth
 
     @lazyproperty
@@ -2411,18 +3067,17 @@ class SourceMorphology(object):
         The main difference is that we do not place a limit on the
         number of labeled regions (previously limited to 100 regions).
         This is also much faster, thanks to the highly optimized
-        "peak_local_max" and "watershed" skimage routines.
+        maximum filter and "watershed" routines.
         Returns a labeled array indicating regions around local maxima.
         """
-        peaks = skimage.feature.peak_local_max(
-            self._cutout_mid_smooth, num_peaks=np.inf)
-        num_peaks = peaks.shape[0]
+        ypeak, xpeak = _peak_local_max(self._cutout_mid_smooth)
+        num_peaks = len(ypeak)
         # The zero label is reserved for the background:
-        peak_labels = np.arange(1, num_peaks+1, dtype=np.int64)
-        ypeak, xpeak = peaks.T
+        peak_labels = np.arange(1, num_peaks+1, dtype=np.int32)
 
-        markers = np.zeros(self._cutout_mid_smooth.shape, dtype=np.int64)
-        markers[ypeak, xpeak] = peak_labels
+        ny, nx = self._cutout_mid_smooth.shape
+        markers = np.zeros((ny, nx), dtype=np.int32)
+        markers.ravel()[ypeak*nx + xpeak] = peak_labels
 
         mask = self._cutout_mid_smooth > 0
         labeled_array = skimage.segmentation.watershed(
@@ -2439,10 +3094,11 @@ class SourceMorphology(object):
         labeled_array, peak_labels, xpeak, ypeak = self._watershed_mid
         num_peaks = len(peak_labels)
 
-        flux_sums = np.zeros(num_peaks, dtype=np.float64)
-        for k, label in enumerate(peak_labels):
-            locs = labeled_array == label
-            flux_sums[k] = np.sum(self._cutout_mid_smooth[locs])
+        # Flux sums over all the labeled regions at once
+        # (note that peak_labels = 1, ..., num_peaks):
+        flux_sums = np.bincount(
+            labeled_array.ravel(), weights=self._cutout_mid_smooth.ravel(),
+            minlength=num_peaks+1)[1:]
         sid = np.argsort(flux_sums)[::-1]
         sorted_flux_sums = flux_sums[sid]
         sorted_xpeak = xpeak[sid]
@@ -2492,7 +3148,7 @@ class SourceMorphology(object):
         yc = M[1, 0] / M[0, 0]
         xc = M[0, 1] / M[0, 0]
 
-        area = np.sum(self._segmap_mid)
+        area = np.count_nonzero(self._segmap_mid)
         D = np.sqrt(np.pi/area) * np.sqrt((xp-xc)**2 + (yp-yc)**2)
 
         if not np.isfinite(D):
@@ -2513,14 +3169,13 @@ class SourceMorphology(object):
         assuming that the center is the point that minimizes the
         asymmetry and that the total is at ``rmax_circ``.
         """
-        image = self._cutout_stamp_maskzeroed
-        center = self._asymmetry_center
-
         if self.rmax_circ == 0:
             r = 0.0
         else:
-            r, flag = _radius_at_fraction_of_total_circ(
-                image, center, self.rmax_circ, 0.5)
+            curve_of_growth = self._curve_of_growth_circ(
+                self._asymmetry_center)
+            r, flag = _radius_at_fraction_of_total(
+                curve_of_growth, self.rmax_circ, 0.5, 'r_circ')
             self.flag = max(self.flag, flag)
 
         # In theory, this return value can also be NaN
@@ -2533,15 +3188,14 @@ class SourceMorphology(object):
         the light, assuming that the center is the point that minimizes
         the asymmetry and that the total is at ``rmax_ellip``.
         """
-        image = self._cutout_stamp_maskzeroed
-        center = self._asymmetry_center
-
         if self.rmax_ellip == 0:
             r = 0.0
         else:
-            r, flag = _radius_at_fraction_of_total_ellip(
-                image, center, self.elongation_asymmetry,
-                self.orientation_asymmetry, self.rmax_ellip, 0.5)
+            curve_of_growth = self._curve_of_growth_ellip(
+                self._asymmetry_center, self.elongation_asymmetry,
+                self.orientation_asymmetry)
+            r, flag = _radius_at_fraction_of_total(
+                curve_of_growth, self.rmax_ellip, 0.5, 'r_ellip')
             self.flag = max(self.flag, flag)
 
         # In theory, this return value can also be NaN
@@ -2569,45 +3223,44 @@ class SourceMorphology(object):
         ny, nx = self._cutout_stamp_maskzeroed.shape
 
         # Center at pixel that minimizes asymmetry
-        center = self._asymmetry_center
+        xc, yc = self._asymmetry_center
 
         # Create a circular annulus around the center
         # that only contains background sky (hopefully).
         r_in = self._petro_extent_flux * self.rpetro_ellip
         r_out = 2.0 * self._petro_extent_flux * self.rpetro_ellip
-        circ_annulus = photutils.CircularAnnulus(center, r_in, r_out)
 
-        # Convert circular annulus aperture to binary mask
-        circ_annulus_mask = circ_annulus.to_mask(method='center')
+        # Binary mask of the annulus with the same shape as the postage
+        # stamp, selecting pixels by their centers (the same as
+        # method='center' for a photutils.CircularAnnulus).
+        y, x = np.ogrid[0:ny, 0:nx]
+        dist_sq = (x - xc)**2 + (y - yc)**2
 
-        # With the same shape as the postage stamp
-        circ_annulus_mask = circ_annulus_mask.to_image((ny, nx))
         # Invert mask and exclude other sources
-        total_mask = self._mask_stamp | np.logical_not(circ_annulus_mask)
+        total_mask = (dist_sq < r_in**2) | (dist_sq >= r_out**2)
+        total_mask |= self._mask_stamp
 
         # If sky area is too small (e.g., if annulus is outside the
         # image), use skybox instead.
-        if np.sum(~total_mask) < self._skybox_size**2:
+        sky_area = total_mask.size - np.count_nonzero(total_mask)
+        if sky_area < self._skybox_size**2:
             if self._verbose:
                 warnings.warn('[shape_asym] Using skybox for background.',
                               AstropyUserWarning)
-            total_mask = np.ones((ny, nx), dtype=np.bool8)
+            total_mask = np.ones((ny, nx), dtype=bool)
             total_mask[self._slice_skybox] = False
             # However, if skybox is undefined, there is nothing to do.
-            if np.sum(~total_mask) == 0:
+            if np.all(total_mask):
                 warnings.warn('[shape_asym] Asymmetry segmap undefined.',
                               AstropyUserWarning)
                 self.flag = 1
                 return ~self._mask_stamp_no_bg
 
-        # Define the "mode" as in Bertin & Arnouts (1996):
-        bkg_estimator = photutils.ModeEstimatorBackground(median_factor=2.5,
-                                                          mean_factor=1.5)
-
-        # Do sigma-clipping until convergence
+        # Do sigma-clipping until convergence, centering on the
+        # "mode" as defined in Bertin & Arnouts (1996):
         mean, median, std = sigma_clipped_stats(
             self._cutout_stamp_maskzeroed, mask=total_mask, sigma=3.0,
-            maxiters=None, cenfunc=bkg_estimator)
+            maxiters=None, cenfunc=_mode_estimator)
 
         # Mode as defined in Bertin & Arnouts (1996)
         mode = 2.5*median - 1.5*mean
@@ -2619,7 +3272,7 @@ class SourceMorphology(object):
         above_threshold = image_smooth >= threshold
 
         # Make sure that brightest pixel (of smoothed image) is in segmap
-        ic, jc = np.argwhere(image_smooth == np.max(image_smooth))[0]
+        ic, jc = np.unravel_index(np.argmax(image_smooth), image_smooth.shape)
         if ~above_threshold[ic, jc]:
             warnings.warn('[shape_asym] Adding brightest pixel to segmap.',
                           AstropyUserWarning)
@@ -2627,8 +3280,8 @@ class SourceMorphology(object):
             self.flag = 1
 
         # Grow regions with 8-connected neighbor "footprint"
-        s = ndi.generate_binary_structure(2, 2)
-        labeled_array, num_features = ndi.label(above_threshold, structure=s)
+        labeled_array, num_features = ndi.label(
+            above_threshold, structure=_structure_8conn)
 
         return labeled_array == labeled_array[ic, jc]
 
@@ -2639,18 +3292,13 @@ class SourceMorphology(object):
         the asymmetry to the edge of the main source segment, similar
         to Pawlik et al. (2016).
         """
-        image = self._cutout_stamp_maskzeroed
-        ny, nx = image.shape
-
         # Center at pixel that minimizes asymmetry
         xc, yc = self._asymmetry_center
 
-        # Distances from all pixels to the center
-        ypos, xpos = np.mgrid[0:ny, 0:nx]
-        distances = np.sqrt((ypos-yc)**2 + (xpos-xc)**2)
-
-        # Only consider pixels within the segmap.
-        rmax_circ = np.max(distances[self._segmap_shape_asym])
+        # Only consider pixels within the segmap. Since the square root
+        # is monotonic, it is only applied to the maximum distance.
+        ypos, xpos = np.nonzero(self._segmap_shape_asym)
+        rmax_circ = np.sqrt(np.max((ypos-yc)**2 + (xpos-xc)**2))
 
         if rmax_circ == 0:
             warnings.warn('[rmax_circ] rmax_circ = 0!', AstropyUserWarning)
@@ -2666,21 +3314,17 @@ class SourceMorphology(object):
         the main segment of the shape asymmetry segmap. In most
         cases this is almost identical to rmax_circ.
         """
-        image = self._cutout_stamp_maskzeroed
-        ny, nx = image.shape
-
         # Center at pixel that minimizes asymmetry
         xc, yc = self._asymmetry_center
 
+        # Only consider pixels within the segmap (see ``rmax_circ``).
         theta = self.orientation_asymmetry
-        y, x = np.mgrid[0:ny, 0:nx]
+        y, x = np.nonzero(self._segmap_shape_asym)
 
         xprime = (x-xc)*np.cos(theta) + (y-yc)*np.sin(theta)
         yprime = -(x-xc)*np.sin(theta) + (y-yc)*np.cos(theta)
-        r_ellip = np.sqrt(xprime**2 + (yprime*self.elongation_asymmetry)**2)
-
-        # Only consider pixels within the segmap.
-        rmax_ellip = np.max(r_ellip[self._segmap_shape_asym])
+        rmax_ellip = np.sqrt(np.max(
+            xprime**2 + (yprime*self.elongation_asymmetry)**2))
 
         if rmax_ellip == 0:
             warnings.warn('[rmax_ellip] rmax_ellip = 0!', AstropyUserWarning)
@@ -2757,9 +3401,13 @@ class SourceMorphology(object):
             self.flag_sersic = 1
             ellip_annulus_mean_flux = np.abs(ellip_annulus_mean_flux)
 
-        # Prepare data for fitting
-        z = image.copy()
-        y, x = np.mgrid[0:ny, 0:nx]
+        # Prepare data for fitting. The pixel coordinates are
+        # broadcast views of 1D ranges, which avoids allocating
+        # two full-size grids (the fitter needs matching shapes).
+        z = image
+        x = np.broadcast_to(np.arange(nx, dtype=np.float64), (ny, nx))
+        y = np.broadcast_to(np.arange(ny, dtype=np.float64)[:, np.newaxis],
+                            (ny, nx))
         weightmap = self._weightmap_stamp
         # Exclude pixels with image == 0 or weightmap == 0 from the fit.
         fit_weights = np.zeros_like(z)
@@ -2867,7 +3515,47 @@ class SourceMorphology(object):
         return theta - np.floor(theta/np.pi) * np.pi
 
 
-def source_morphology(image, segmap, **kwargs):
+_worker_data = {}
+
+
+def _init_source_morphology_worker(image, segmap, kwargs):
+    """
+    Store the arrays shared by all sources in a worker process, so
+    that they are only pickled once per worker instead of once per
+    source.
+    """
+    _worker_data['image'] = image
+    _worker_data['segmap'] = segmap
+    _worker_data['kwargs'] = kwargs
+
+
+def _source_morphology_worker(label):
+    """
+    Measure the morphology of a single source in a worker process.
+    The references to the full-size input arrays (and the full-size
+    mask derived from them, which can be recomputed) are dropped before
+    returning, so that they are not pickled back with every source
+    (see ``_attach_input_arrays``).
+    """
+    morph = SourceMorphology(_worker_data['image'], _worker_data['segmap'],
+                             label, **_worker_data['kwargs'])
+    _attach_input_arrays(morph, None, None, None, None)
+    morph.__dict__.pop('_mask_full', None)
+    return morph
+
+
+def _attach_input_arrays(morph, image, segmap, mask, weightmap):
+    """
+    Set the references of a `SourceMorphology` object to the full-size
+    input arrays.
+    """
+    morph._image = image
+    morph._segmap = segmap
+    morph._mask = mask
+    morph._weightmap = weightmap
+
+
+def source_morphology(image, segmap, n_jobs=1, **kwargs):
     """
     Calculate the morphological parameters of all sources in ``image``
     as labeled by ``segmap``.
@@ -2884,6 +3572,14 @@ def source_morphology(image, segmap, **kwargs):
 
     Other parameters
     ----------------
+    n_jobs : int, optional
+        The number of worker processes used to measure the sources
+        in parallel. A negative value means ``os.cpu_count() + 1 +
+        n_jobs`` (i.e., -1 uses all CPUs). The default value of 1
+        processes the sources serially in the current process.
+        Note that warnings emitted by worker processes are not
+        propagated. As in the serial case, the returned objects
+        share the input arrays of the current process.
     kwargs : `~statmorph.SourceMorphology` properties.
 
     Returns
@@ -2909,8 +3605,29 @@ def source_morphology(image, segmap, **kwargs):
     if not isinstance(segmap, photutils.SegmentationImage):
         segmap = photutils.SegmentationImage(segmap)
 
-    sources_morph = []
-    for label in segmap.labels:
-        sources_morph.append(SourceMorphology(image, segmap, label, **kwargs))
+    if (not isinstance(n_jobs, (int, np.integer)) or
+            isinstance(n_jobs, bool) or n_jobs == 0):
+        raise ValueError('n_jobs must be a nonzero integer, got %r.' % (
+            n_jobs,))
+    if n_jobs < 0:
+        # os.cpu_count() returns None if undetermined
+        num_cpus = os.cpu_count() or 1
+        n_jobs = max(num_cpus + 1 + n_jobs, 1)
+
+    if n_jobs == 1 or segmap.nlabels == 1:
+        sources_morph = []
+        for label in segmap.labels:
+            sources_morph.append(
+                SourceMorphology(image, segmap, label, **kwargs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(n_jobs, segmap.nlabels),
+                initializer=_init_source_morphology_worker,
+                initargs=(image, segmap, kwargs)) as executor:
+            sources_morph = list(executor.map(
+                _source_morphology_worker, segmap.labels))
+        for morph in sources_morph:
+            _attach_input_arrays(morph, image, segmap, kwargs.get('mask'),
+                                 kwargs.get('weightmap'))
 
     return sources_morph
@@ -33,6 +33,99 @@ def test_quantile():
         _ = _quantile(data, 1.5)
 
 
+def test_curve_of_growth_circ():
+    import photutils
+    from statmorph.statmorph import _CurveOfGrowthCirc
+    np.random.seed(0)
+    image = np.random.standard_normal(size=(40, 50))
+    center = (23.3, 18.7)
+    radii = np.array([0.0, 0.4, 1.0, 3.7, 12.5, 30.0])
+    curve_of_growth = _CurveOfGrowthCirc(image, center)
+    # Compare with photutils (exact pixel overlaps).
+    res1 = curve_of_growth(radii)
+    res2 = [0.0]
+    for r in radii[1:]:
+        ap = photutils.CircularAperture(center, r)
+        res2.append(ap.do_photometry(image, method='exact')[0][0])
+    assert_allclose(res1, res2, rtol=1e-10, atol=1e-10)
+
+
+def test_curve_of_growth_ellip():
+    import photutils
+    from statmorph.statmorph import (
+        _CurveOfGrowthEllip, _elliptical_annulus_flux)
+    np.random.seed(0)
+    image = np.random.standard_normal(size=(40, 50))
+    center = (23.3, 18.7)
+    elongation, theta = 2.6, 0.7
+    a_values = np.array([0.0, 0.4, 1.0, 3.7, 12.5, 30.0])
+    curve_of_growth = _CurveOfGrowthEllip(image, center, elongation, theta)
+    # Compare with photutils (exact pixel overlaps).
+    res1 = curve_of_growth(a_values)
+    res2 = [0.0]
+    for a in a_values[1:]:
+        ap = photutils.EllipticalAperture(center, a, a / elongation,
+                                          theta=theta)
+        res2.append(ap.do_photometry(image, method='exact')[0][0])
+    assert_allclose(res1, res2, rtol=1e-10, atol=1e-10)
+    # Same for an elliptical annulus.
+    ap = photutils.EllipticalAnnulus(center, 3.7, 12.5, 12.5 / elongation,
+                                     theta=theta)
+    assert_allclose(
+        _elliptical_annulus_flux(image, center, 3.7, 12.5, elongation, theta),
+        ap.do_photometry(image, method='exact')[0][0], rtol=1e-10)
+
+
+def test_gaussian_filter():
+    import scipy.ndimage as ndi
+    from statmorph.statmorph import _gaussian_filter
+    np.random.seed(0)
+    image = np.random.standard_normal(size=(40, 50))
+    # Large sigma values use FFTs; compare with scipy.ndimage.
+    for sigma in [1.5, 12.0, 30.0]:
+        assert_allclose(_gaussian_filter(image, sigma),
+                        ndi.gaussian_filter(image, sigma), atol=1e-12)
+
+
+def test_rotate_180():
+    import skimage.transform
+    from statmorph.statmorph import _rotate_180, _rotate_180_nearest
+    np.random.seed(0)
+    image = np.random.standard_normal(size=(40, 50))
+    mask = image > 1.0
+    for center in [(24.5, 19.5), (20.0, 25.0), (13.3, 31.7), (45.6, 2.1)]:
+        assert_allclose(_rotate_180(image, center),
+                        skimage.transform.rotate(image, 180.0, center=center),
+                        atol=1e-12)
+        # Boolean masks are rotated with nearest-neighbor sampling.
+        mask_180 = skimage.transform.rotate(mask, 180.0, center=center)
+        assert np.array_equal(_rotate_180_nearest(mask, center),
+                              mask_180 >= 0.5)
+
+
+def test_peak_local_max():
+    import scipy.ndimage as ndi
+    import skimage.feature
+    from statmorph.statmorph import _peak_local_max
+    np.random.seed(0)
+    image = ndi.gaussian_filter(np.random.standard_normal(size=(40, 50)), 2.0)
+    image[20:23, 30:33] = 10.0  # plateau
+    peaks = skimage.feature.peak_local_max(image, num_peaks=np.inf)
+    ypeak, xpeak = _peak_local_max(image)
+    assert_allclose(np.column_stack([ypeak, xpeak]), peaks)
+
+
+def test_mode_estimator():
+    import photutils
+    from statmorph.statmorph import _mode_estimator
+    bkg_estimator = photutils.ModeEstimatorBackground(median_factor=2.5,
+                                                      mean_factor=1.5)
+    np.random.seed(0)
+    for dtype in [np.float32, np.float64]:
+        data = (np.random.standard_cauchy(size=1000) + 5.0).astype(dtype)
+        assert _mode_estimator(data) == bkg_estimator(data)
+
+
 def test_convolved_sersic():
     from scipy.signal import fftconvolve
     # Create Gaussian PSF.
@@ -84,7 +177,7 @@ def test_masked_centroid():
     y, x = np.mgrid[0:ny, 0:nx]
     image = np.exp(-(x - 5) ** 2 - (y - 5) ** 2)
     segmap = np.int64(image > 1e-3)
-    mask = np.zeros((ny, nx), dtype=np.bool8)
+    mask = np.zeros((ny, nx), dtype=bool)
     mask[5, 5] = True
     with catch_warnings(AstropyUserWarning) as w:
         morph = statmorph.SourceMorphology(image, segmap, label, gain=1.0,
@@ -346,7 +439,7 @@ class TestSourceMorphology(object):
         with fits.open('%s/data/slice.fits' % (curdir,)) as hdulist:
             self.image = hdulist[0].data
             self.segmap = hdulist[1].data
-            self.mask = np.bool8(hdulist[2].data)
+            self.mask = np.bool_(hdulist[2].data)
         self.gain = 1.0
 
     def test_no_psf(self, print_values=False):
@@ -382,6 +475,39 @@ class TestSourceMorphology(object):
             assert_allclose(morph[key], self.correct_values[key],
                             err_msg="%s value did not match." % (key,))
 
+    def test_n_jobs(self):
+        # Two copies of the same galaxy, measured serially and in parallel.
+        image = np.hstack([self.image, self.image])
+        segmap = np.hstack([self.segmap, 2 * self.segmap])
+        mask = np.hstack([self.mask, self.mask])
+        serial_morphs = statmorph.source_morphology(
+            image, segmap, mask=mask, gain=self.gain)
+        parallel_morphs = statmorph.source_morphology(
+            image, segmap, mask=mask, gain=self.gain, n_jobs=2)
+        assert len(parallel_morphs) == 2
+        for morph1, morph2 in zip(serial_morphs, parallel_morphs):
+            assert morph1.label == morph2.label
+            for key in self.correct_values:
+                assert_allclose(morph2[key], morph1[key],
+                                err_msg="%s value did not match." % (key,))
+            # The input arrays are shared, not copied back from workers.
+            assert morph2._image is image
+            assert morph2._mask is mask
+            assert morph2._segmap is parallel_morphs[0]._segmap
+
+    def test_n_jobs_invalid(self, monkeypatch):
+        for n_jobs in [0, None, 1.5]:
+            with pytest.raises(ValueError):
+                statmorph.source_morphology(
+                    self.image, self.segmap, mask=self.mask, gain=self.gain,
+                    n_jobs=n_jobs)
+        # Fall back to a single process if the number of CPUs is unknown.
+        monkeypatch.setattr(os, 'cpu_count', lambda: None)
+        source_morphs = statmorph.source_morphology(
+            self.image, self.segmap, mask=self.mask, gain=self.gain,
+            n_jobs=-1)
+        assert len(source_morphs) == 1
+
 
 def runall(print_values=False):
     """